@@ -0,0 +1,219 @@
+# -*- encoding: utf-8 -*-
+import os
+import time
+import pickle
+import hashlib
+import tempfile
+import threading
+from typing import Optional, Any
+
+KLEE_UNIT_CACHE_DIR = os.environ.get(
+    "KLEE_UNIT_CACHE_DIR",
+    os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "klee-unit"))
+
+CHECKSUM_SIZE = hashlib.sha256().digest_size
+
+EVICTION_TARGET = 0.9  # fraction of max_size an eviction by size goes down to, so that the next puts do not evict again
+
+# Total size of the entries of each cache directory, scanned by the first DiskCache of the directory in this process and
+# then tracked by its puts and removals. Entries of other processes are only counted at the next eviction.
+_dir_sizes: dict[str, int] = {}
+_dir_sizes_lock = threading.Lock()
+
+
+class DiskCache:
+    """
+    Content-addressed on-disk cache. Entries are files named by key, evicted by age and by total size (least recently
+    used first). The directory is scanned once per process, then only when its total size exceeds max_size, so creating
+    more instances of the same directory is cheap.
+    """
+
+    def __init__(self, directory: str, max_size: int = 512 * 1024 * 1024, max_age: float = 30 * 24 * 3600) -> None:
+        """
+        :param directory: cache directory, created if missing
+        :param max_size: maximal total size of entries in bytes
+        :param max_age: maximal time in seconds since an entry was last used
+        """
+        self._dir = directory
+        self._max_size = max_size
+        self._max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self._dir, exist_ok=True)
+        with _dir_sizes_lock:
+            if self._dir not in _dir_sizes:
+                self._evict()
+
+    @property
+    def directory(self) -> str:
+        return self._dir
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """
+        Make a cache key from str, bytes or iterables of them.
+        """
+        h = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, (list, tuple)):
+                part = "\0".join(part)
+            if isinstance(part, str):
+                part = part.encode("utf-8")
+            h.update(len(part).to_bytes(8, "little"))
+            h.update(part)
+        return h.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self._dir, key[:2], key)
+
+    def get_path(self, key: str) -> Optional[str]:
+        """
+        Lookup an entry and return its path, or None on a miss.
+        """
+        path = self._entry_path(key)
+        try:
+            os.utime(path)  # refresh for LRU eviction
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:  # evicted by another session
+            self.hits -= 1
+            self.misses += 1
+            return None
+
+    def put(self, key: str, data: bytes) -> str:
+        """
+        Atomically store an entry.
+        :return: path of the entry
+        """
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            replaced_size = self._entry_size(path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with _dir_sizes_lock:
+            _dir_sizes[self._dir] += len(data) - replaced_size
+            if _dir_sizes[self._dir] > self._max_size:
+                self._evict()
+        return path
+
+    def put_file(self, key: str, filename: str) -> str:
+        """
+        Store the content of a file as an entry.
+        :return: path of the entry
+        """
+        with open(filename, "rb") as f:
+            return self.put(key, f.read())
+
+    def load(self, key: str, checksum: bool = False) -> Any:
+        """
+        Lookup a pickled object, or return None on a miss.
+        :param checksum: the entry was stored with a checksum, which is verified
+        """
+        data = self.get(key)
+        if data is None:
+            return None
+        try:
+            if checksum:
+                expected, data = data[:CHECKSUM_SIZE], data[CHECKSUM_SIZE:]
+                if hashlib.sha256(data).digest() != expected:
+                    raise ValueError("checksum mismatch")
+            return pickle.loads(data)
+        except Exception:  # corrupted or incompatible entry
+            self.hits -= 1
+            self.misses += 1
+            self.remove(key)
+            return None
+
+    def store(self, key: str, obj: Any, checksum: bool = False) -> str:
+        """
+        Store a pickled object.
+        :param checksum: prepend the SHA-256 of the pickle, to detect corrupted entries when they are loaded
+        """
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        if checksum:
+            data = hashlib.sha256(data).digest() + data
+        return self.put(key, data)
+
+    def remove(self, key: str) -> None:
+        path = self._entry_path(key)
+        size = self._entry_size(path)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return
+        with _dir_sizes_lock:
+            _dir_sizes[self._dir] -= size
+
+    @staticmethod
+    def _entry_size(path: str) -> int:
+        try:
+            return os.stat(path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def evict(self) -> None:
+        """
+        Remove entries older than max_age, then if the total size exceeds max_size, least recently used entries until it
+        is down to EVICTION_TARGET of max_size.
+        """
+        with _dir_sizes_lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        # With _dir_sizes_lock held, also (re)counts the total size of the entries
+        now = time.time()
+        entries = []
+        total_size = 0
+        for sub in os.scandir(self._dir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.startswith(".tmp-"):
+                    if now - st.st_mtime > 3600:  # leftover of an interrupted put
+                        self._unlink(entry.path)
+                    continue
+                if now - st.st_mtime > self._max_age:
+                    self._unlink(entry.path)
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total_size += st.st_size
+
+        if total_size > self._max_size:
+            entries.sort()
+            for _, size, path in entries:
+                self._unlink(path)
+                total_size -= size
+                if total_size <= self._max_size * EVICTION_TARGET:
+                    break
+        _dir_sizes[self._dir] = total_size
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
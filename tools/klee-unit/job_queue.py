@@ -0,0 +1,409 @@
+# -*- encoding: utf-8 -*-
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import shutil
+import sqlite3
+import tarfile
+import argparse
+import tempfile
+import threading
+from contextlib import closing
+from abc import ABC, abstractmethod
+from typing import Optional
+from dataclasses import dataclass, field, asdict
+
+from klee_unit_core import KLEEUnitSession, ArgumentDriverType
+from klee_governor import KLEEBudget
+
+DEFAULT_LEASE_TIME = 300  # seconds a claimed job stays leased without being renewed
+DEFAULT_MAX_ATTEMPTS = 3  # claims of a job before it is given up
+
+
+@dataclass
+class Job:
+    """
+    A function-level klee-unit job.
+    """
+    src_file: str
+    func_name: str
+    arg_options: dict[str, str] = field(default_factory=dict)  # argument name -> ArgumentDriverType name
+    time_budget: float = 60
+    budget: Optional[dict] = None  # fields of KLEEBudget
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    def get_arg_options(self) -> dict[str, ArgumentDriverType]:
+        return {name: ArgumentDriverType[option] for name, option in self.arg_options.items()}
+
+    def get_budget(self) -> Optional[KLEEBudget]:
+        return KLEEBudget(**self.budget) if self.budget is not None else None
+
+
+class JobQueue(ABC):
+    """
+    Queue of jobs shared by workers. A worker claims a job with a lease, which it renews while running the job. Jobs
+    whose lease expires go back to the queue with requeue_expired(), so that jobs of dead workers are not lost.
+    """
+
+    @abstractmethod
+    def submit(self, job: Job) -> str:
+        """
+        Add a job to the queue.
+        :return: job ID
+        """
+        pass
+
+    @abstractmethod
+    def claim(self, worker: str, lease_time: float = DEFAULT_LEASE_TIME) -> Optional[Job]:
+        """
+        Claim the oldest queued job.
+        :return: Job, or None if no job is queued
+        """
+        pass
+
+    @abstractmethod
+    def renew(self, job_id: str, worker: str, lease_time: float = DEFAULT_LEASE_TIME) -> bool:
+        """
+        Extend the lease of a claimed job.
+        :return: False if the job is not leased to the worker anymore
+        """
+        pass
+
+    @abstractmethod
+    def complete(self, job_id: str, worker: str, result: dict, bundle_file: Optional[str] = None) -> bool:
+        """
+        Record the result of a claimed job and upload its result bundle (a .tar.gz).
+        :return: False if the job is not leased to the worker anymore (the result is then dropped)
+        """
+        pass
+
+    @abstractmethod
+    def requeue_expired(self, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> int:
+        """
+        Put jobs with an expired lease back to the queue, or mark them as failed after max_attempts claims.
+        :return: number of requeued jobs
+        """
+        pass
+
+    @abstractmethod
+    def counts(self) -> dict[str, int]:
+        """
+        Get the number of jobs of each status ("queued", "leased", "done" and "failed").
+        """
+        pass
+
+    @abstractmethod
+    def results(self) -> list[tuple[Job, str, Optional[dict]]]:
+        """
+        Get all jobs with their status and result, in the order of submission.
+        """
+        pass
+
+    @abstractmethod
+    def fetch_bundle(self, job_id: str, directory: str) -> bool:
+        """
+        Extract the result bundle of a job to a directory.
+        :return: False if the job has no bundle
+        """
+        pass
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    JobQueue backed by a SQLite database, with result bundles stored next to it. Suitable for workers on one machine,
+    or on several machines sharing a file system with working locks.
+    """
+
+    def __init__(self, filename: str) -> None:
+        self._filename = os.path.abspath(filename)
+        self._bundle_dir = os.path.splitext(self._filename)[0] + "-bundles"
+        os.makedirs(self._bundle_dir, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                                id TEXT UNIQUE NOT NULL,
+                                spec TEXT NOT NULL,
+                                status TEXT NOT NULL DEFAULT 'queued',
+                                worker TEXT,
+                                lease_expires REAL,
+                                attempts INTEGER NOT NULL DEFAULT 0,
+                                result TEXT,
+                                bundle TEXT)""")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode, with explicit BEGIN IMMEDIATE where a read must be followed by a consistent write. The
+        # default rollback journal is kept: it relies on file locks only, whereas the WAL index is shared memory, which
+        # hosts sharing the database over a network file system do not share.
+        return sqlite3.connect(self._filename, timeout=30, isolation_level=None)
+
+    def submit(self, job: Job) -> str:
+        with closing(self._connect()) as conn:
+            conn.execute("INSERT INTO jobs (id, spec) VALUES (?, ?)", (job.id, json.dumps(asdict(job))))
+        return job.id
+
+    def claim(self, worker: str, lease_time: float = DEFAULT_LEASE_TIME) -> Optional[Job]:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT id, spec FROM jobs WHERE status = 'queued' ORDER BY seq LIMIT 1").fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                         "WHERE id = ?", (worker, time.time() + lease_time, row[0]))
+            conn.execute("COMMIT")
+            return Job(**json.loads(row[1]))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def renew(self, job_id: str, worker: str, lease_time: float = DEFAULT_LEASE_TIME) -> bool:
+        with closing(self._connect()) as conn:
+            cursor = conn.execute("UPDATE jobs SET lease_expires = ? WHERE id = ? AND status = 'leased' AND worker = ?",
+                                  (time.time() + lease_time, job_id, worker))
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker: str, result: dict, bundle_file: Optional[str] = None) -> bool:
+        bundle = None
+        if bundle_file is not None:
+            # Upload under a temporary name first, so that a bundle is either complete or absent, and under a name of
+            # its own, so that a worker whose lease expired cannot overwrite the bundle of the worker owning the job now
+            bundle = os.path.join(self._bundle_dir, f"{job_id}-{uuid.uuid4().hex}.tar.gz")
+            fd, tmp_path = tempfile.mkstemp(dir=self._bundle_dir, prefix=".upload-")
+            os.close(fd)
+            shutil.copyfile(bundle_file, tmp_path)
+            os.replace(tmp_path, bundle)
+
+        status = "failed" if result.get("status") == "failed" else "done"
+        with closing(self._connect()) as conn:
+            cursor = conn.execute("UPDATE jobs SET status = ?, result = ?, bundle = ?, lease_expires = NULL "
+                                  "WHERE id = ? AND status = 'leased' AND worker = ?",
+                                  (status, json.dumps(result), bundle, job_id, worker))
+            completed = cursor.rowcount == 1
+        if not completed and bundle is not None:
+            os.remove(bundle)
+        return completed
+
+    def requeue_expired(self, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> int:
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("UPDATE jobs SET status = 'failed', result = ? "
+                         "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                         (json.dumps({"status": "failed", "stage": "worker",
+                                      "message": f"lease expired {max_attempts} times"}), now, max_attempts))
+            cursor = conn.execute("UPDATE jobs SET status = 'queued', worker = NULL, lease_expires = NULL "
+                                  "WHERE status = 'leased' AND lease_expires < ?", (now,))
+            return cursor.rowcount
+
+    def counts(self) -> dict[str, int]:
+        ret = {"queued": 0, "leased": 0, "done": 0, "failed": 0}
+        with closing(self._connect()) as conn:
+            for status, count in conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+                ret[status] = count
+        return ret
+
+    def results(self) -> list[tuple[Job, str, Optional[dict]]]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT spec, status, result FROM jobs ORDER BY seq").fetchall()
+        return [(Job(**json.loads(spec)), status, json.loads(result) if result is not None else None)
+                for spec, status, result in rows]
+
+    def fetch_bundle(self, job_id: str, directory: str) -> bool:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT bundle FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row[0] is None or not os.path.exists(row[0]):
+            return False
+        os.makedirs(directory, exist_ok=True)
+        with tarfile.open(row[0], "r:gz") as tar:
+            if hasattr(tarfile, "data_filter"):
+                tar.extractall(directory, filter="data")  # reject absolute paths, links out of directory, etc.
+            else:  # Python without extraction filters
+                tar.extractall(directory)
+        return True
+
+
+def _make_bundle(directory: str, bundle_file: str) -> None:
+    with tarfile.open(bundle_file, "w:gz") as tar:
+        for name in sorted(os.listdir(directory)):
+            tar.add(os.path.join(directory, name), arcname=name)
+
+
+def run_job(queue: JobQueue, job: Job, worker: str, work_dir: str, lease_time: float = DEFAULT_LEASE_TIME) -> dict:
+    """
+    Run a claimed job with the batch pipeline, renewing its lease meanwhile, and upload the result bundle (generated
+    tests, KLEE logs, test cases and run.stats).
+    :return: result of the job (fields of FunctionResult)
+    """
+    from klee_unit_batch import run_function, FunctionResult
+
+    # Keep the lease while the job runs
+    done = threading.Event()
+
+    def renew_lease():
+        while not done.wait(lease_time / 3):
+            if not queue.renew(job.id, worker, lease_time):
+                print(f"Lost the lease of job {job.id}", file=sys.stderr)
+                return
+
+    renew_thread = threading.Thread(target=renew_lease, name=f"renew-{job.id}", daemon=True)
+    renew_thread.start()
+
+    job_dir = os.path.join(work_dir, job.id)
+    try:
+        try:
+            result = run_function(job.src_file, job.func_name, job_dir, job.time_budget, budget=job.get_budget(),
+                                  arg_options=job.get_arg_options(), save_klee_output=True)
+        except Exception as e:
+            result = FunctionResult(name=job.func_name, status="failed", stage="job", message=str(e))
+        result_dict = asdict(result)
+
+        bundle_file = os.path.join(work_dir, f"{job.id}.tar.gz")
+        func_dir = os.path.join(job_dir, job.func_name)
+        if os.path.isdir(func_dir):
+            _make_bundle(func_dir, bundle_file)
+        else:
+            bundle_file = None
+    finally:
+        done.set()
+
+    if not queue.complete(job.id, worker, result_dict, bundle_file):
+        print(f"Result of job {job.id} dropped, its lease expired", file=sys.stderr)
+    shutil.rmtree(job_dir, ignore_errors=True)
+    if bundle_file is not None:
+        os.remove(bundle_file)
+    return result_dict
+
+
+def run_worker(queue: JobQueue, work_dir: str, worker: Optional[str] = None, lease_time: float = DEFAULT_LEASE_TIME,
+               poll_interval: float = 5, once: bool = False) -> int:
+    """
+    Claim and run jobs until the queue is empty (once=True) or forever.
+    :return: number of jobs run
+    """
+    if worker is None:
+        worker = f"{socket.gethostname()}-{os.getpid()}"
+    os.makedirs(work_dir, exist_ok=True)
+    count = 0
+    while True:
+        job = queue.claim(worker, lease_time)
+        if job is None:
+            if once:
+                return count
+            time.sleep(poll_interval)
+            continue
+        print(f"[{worker}] {job.func_name} ({job.id})", file=sys.stderr)
+        result = run_job(queue, job, worker, work_dir, lease_time)
+        print(f"[{worker}] {job.func_name}: {result['status']}, {result['test_cases']} test cases", file=sys.stderr)
+        count += 1
+
+
+def run_coordinator(queue: JobQueue, output_dir: str, poll_interval: float = 5,
+                    max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> dict:
+    """
+    Requeue expired leases until every job is done or failed, then extract the result bundles to
+    <output_dir>/<function>/ and write <output_dir>/report.json in the format of batch mode.
+    :return: the report
+    """
+    while True:
+        requeued = queue.requeue_expired(max_attempts)
+        if requeued:
+            print(f"Requeued {requeued} jobs with expired leases", file=sys.stderr)
+        counts = queue.counts()
+        if counts["queued"] == 0 and counts["leased"] == 0:
+            break
+        print(f"{counts['done']} done, {counts['failed']} failed, {counts['leased']} running, "
+              f"{counts['queued']} queued", file=sys.stderr)
+        time.sleep(poll_interval)
+
+    os.makedirs(output_dir, exist_ok=True)
+    functions = []
+    for job, status, result in queue.results():
+        func_dir = os.path.join(output_dir, job.func_name)
+        if result is None:
+            result = {"name": job.func_name, "status": status}
+        result = dict(result, job_id=job.id, src_file=job.src_file)
+        if queue.fetch_bundle(job.id, func_dir):
+            # Paths in the result point to the worker, relocate them
+            for key in ("test_file", "log_file"):
+                if result.get(key) is not None:
+                    result[key] = os.path.join(func_dir, os.path.basename(result[key]))
+        functions.append(result)
+
+    report = {"functions": functions}
+    with open(os.path.join(output_dir, "report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    subparsers = parser.add_subparsers(dest="queue_command", required=True)
+
+    submit_parser = subparsers.add_parser("submit", help="submit jobs for functions of a source file")
+    submit_parser.add_argument("queue", help="queue database")
+    submit_parser.add_argument("src_file", help="source file under test")
+    submit_parser.add_argument("-f", "--func", action="append", dest="funcs", metavar="name",
+                               help="function to test (can be repeated, default: all functions defined in the source "
+                                    "file)")
+    submit_parser.add_argument("-a", "--arg", action="append", dest="args", default=[], metavar="name=OPTION",
+                               help="driver option of an argument, e.g. x=SYMBOLIC (can be repeated)")
+    submit_parser.add_argument("-t", "--time-budget", type=float, default=60,
+                               help="KLEE time budget per function in seconds (default: %(default)s)")
+    submit_parser.add_argument("--max-instructions", type=int, default=None,
+                               help="stop KLEE after executing this many instructions")
+    submit_parser.add_argument("--max-tests", type=int, default=None,
+                               help="stop KLEE after writing this many test cases")
+
+    worker_parser = subparsers.add_parser("worker", help="run jobs from a queue")
+    worker_parser.add_argument("queue", help="queue database")
+    worker_parser.add_argument("-w", "--work-dir", default="klee-unit-work",
+                               help="directory for running jobs (default: %(default)s)")
+    worker_parser.add_argument("--lease-time", type=float, default=DEFAULT_LEASE_TIME,
+                               help="lease of a claimed job in seconds (default: %(default)s)")
+    worker_parser.add_argument("--once", action="store_true", help="exit once the queue is empty")
+
+    coordinate_parser = subparsers.add_parser("coordinate",
+                                              help="requeue expired jobs until all are finished, and collect results")
+    coordinate_parser.add_argument("queue", help="queue database")
+    coordinate_parser.add_argument("-o", "--output-dir", default="klee-unit-out",
+                                   help="output directory (default: %(default)s)")
+    coordinate_parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                                   help="claims of a job before it is given up (default: %(default)s)")
+
+
+def main(args: argparse.Namespace) -> int:
+    queue = SQLiteJobQueue(args.queue)
+
+    if args.queue_command == "submit":
+        src_file = os.path.abspath(args.src_file)
+        funcs = args.funcs
+        if funcs is None:
+            session = KLEEUnitSession()
+            session.set_src_file(src_file)
+            session.analyze_src()
+            funcs = session.get_defined_funcs()
+        arg_options = {}
+        for arg in args.args:
+            name, _, option = arg.partition("=")
+            if option not in ArgumentDriverType.__members__:
+                print(f"Unknown option {option} of argument {name}", file=sys.stderr)
+                return 1
+            arg_options[name] = option
+        budget = KLEEBudget(instructions=args.max_instructions, test_cases=args.max_tests)
+        for func in funcs:
+            job = Job(src_file, func, arg_options, args.time_budget,
+                      asdict(budget) if not budget.is_unlimited() else None)
+            print(queue.submit(job), func)
+        return 0
+
+    elif args.queue_command == "worker":
+        run_worker(queue, os.path.abspath(args.work_dir), lease_time=args.lease_time, once=args.once)
+        return 0
+
+    else:
+        report = run_coordinator(queue, os.path.abspath(args.output_dir), max_attempts=args.max_attempts)
+        return 1 if any(f["status"] == "failed" for f in report["functions"]) else 0
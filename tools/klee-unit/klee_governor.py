@@ -0,0 +1,108 @@
+# -*- encoding: utf-8 -*-
+import time
+import threading
+from typing import Optional, Callable
+from dataclasses import dataclass
+
+from klee_run import KLEERun
+
+
+@dataclass
+class KLEEBudget:
+    """
+    Limits of a KLEE run. In portfolio mode, instructions, test cases and memory are summed over the instances.
+    """
+    wall_time: Optional[float] = None  # seconds
+    instructions: Optional[int] = None  # executed LLVM instructions
+    test_cases: Optional[int] = None  # test cases written by KLEE
+    memory: Optional[int] = None  # bytes allocated by KLEE (MallocUsage in run.stats)
+    coverage_plateau: Optional[float] = None  # seconds without newly covered instructions
+
+    def is_unlimited(self) -> bool:
+        return all(v is None for v in (self.wall_time, self.instructions, self.test_cases, self.memory,
+                                       self.coverage_plateau))
+
+
+class KLEEGovernor:
+    """
+    Enforce a KLEEBudget in a background thread. The thread polls run.stats of the KLEE runs (and the number of test
+    cases they wrote), and interrupts all of them with SIGINT once any limit is exceeded, so that KLEE still writes the
+    test cases of its current states.
+    """
+
+    def __init__(self, runs: list[KLEERun], budget: KLEEBudget, interval: float = 0.5,
+                 on_exceeded: Optional[Callable[[str], None]] = None) -> None:
+        """
+        :param runs: KLEE runs, already started
+        :param budget: KLEEBudget
+        :param interval: polling interval in seconds
+        :param on_exceeded: called from the governor thread with the reason once the budget is exceeded
+        """
+        self._runs = runs
+        self._budget = budget
+        self._interval = interval
+        self._on_exceeded = on_exceeded
+        self._start_time = time.monotonic()
+        self._covered = 0
+        self._last_coverage_time = self._start_time
+        self._exceeded: Optional[str] = None
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="KLEEGovernor", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    @property
+    def exceeded(self) -> Optional[str]:
+        """
+        Reason why the runs were interrupted, or None if the budget has not been exceeded.
+        """
+        return self._exceeded
+
+    def check(self) -> Optional[str]:
+        """
+        Check the budget once.
+        :return: the exceeded limit, or None
+        """
+        budget = self._budget
+        now = time.monotonic()
+        rows = []
+        for run in self._runs:
+            run.stats_reader.read_new()
+            if run.stats_reader.latest is not None:
+                rows.append(run.stats_reader.latest)
+
+        if budget.wall_time is not None and now - self._start_time >= budget.wall_time:
+            return f"wall time of {budget.wall_time}s"
+        if budget.instructions is not None and sum(row.get("Instructions", 0) for row in rows) >= budget.instructions:
+            return f"{budget.instructions} instructions"
+        if budget.test_cases is not None and \
+                sum(run.ktest_watcher.emitted for run in self._runs if run.ktest_watcher is not None) \
+                >= budget.test_cases:
+            return f"{budget.test_cases} test cases"
+        if budget.memory is not None and sum(row.get("MallocUsage", 0) for row in rows) >= budget.memory:
+            return f"{budget.memory} bytes of memory"
+
+        covered = sum(row.get("CoveredInstructions", 0) for row in rows)
+        if covered > self._covered:
+            self._covered = covered
+            self._last_coverage_time = now
+        if budget.coverage_plateau is not None and now - self._last_coverage_time >= budget.coverage_plateau:
+            return f"no new coverage for {budget.coverage_plateau}s"
+        return None
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self._interval):
+            if not any(run.is_running() for run in self._runs):
+                return
+            reason = self.check()
+            if reason is not None:
+                self._exceeded = reason
+                for run in self._runs:
+                    run.interrupt()
+                if self._on_exceeded is not None:
+                    self._on_exceeded(reason)
+                return
@@ -0,0 +1,97 @@
+# -*- encoding: utf-8 -*-
+import os
+import codecs
+import threading
+from collections import deque
+from typing import Optional, Callable, BinaryIO
+
+
+class KLEEOutputReader:
+    """
+    Read the output of KLEE in a background thread. The output is decoded incrementally (so multibyte characters split
+    across reads survive) and kept as lines in fixed-size ring buffers, optionally spilling the full output to a file,
+    so that memory stays flat however long KLEE runs.
+    """
+
+    def __init__(self, stream: BinaryIO, max_lines: int = 10000, spill_file: Optional[str] = None,
+                 callback: Optional[Callable[[], None]] = None) -> None:
+        """
+        :param stream: binary stream to read, e.g. stdout of the KLEE process
+        :param max_lines: number of lines kept in memory, both for tail() and for output not read by read_new() yet
+        :param spill_file: file to write the full output to, or None
+        :param callback: called from the reader thread after new output is available and at EOF
+        """
+        self._fd = stream.fileno()
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._tail: deque[str] = deque(maxlen=max_lines)
+        self._pending: deque[str] = deque(maxlen=max_lines)
+        self._dropped = 0  # lines dropped from _pending before being read
+        self._partial = ""  # incomplete last line
+        self._spill_file = spill_file
+        self._callback = callback
+        self._lock = threading.Lock()
+        self._eof = False
+        self._thread = threading.Thread(target=self._run, name="KLEEOutputReader", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        self._thread.join(timeout)
+
+    def is_eof(self) -> bool:
+        return self._eof
+
+    def read_new(self) -> str:
+        """
+        Get the complete lines read since the last call. If more than max_lines lines were not read in time, the
+        oldest ones are replaced by a note.
+        """
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            lines.insert(0, f"[... {dropped} lines dropped, see the full log ...]\n")
+        return "".join(lines)
+
+    def tail(self) -> str:
+        """
+        Get the last max_lines lines.
+        """
+        with self._lock:
+            return "".join(self._tail)
+
+    def _add(self, text: str, final: bool = False) -> None:
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()  # empty if the text ends with a newline
+        lines = [line + "\n" for line in lines]
+        if final and self._partial:
+            lines.append(self._partial)
+            self._partial = ""
+        with self._lock:
+            for line in lines:
+                if len(self._pending) == self._pending.maxlen:
+                    self._dropped += 1
+                self._pending.append(line)
+                self._tail.append(line)
+
+    def _run(self) -> None:
+        spill = open(self._spill_file, "w", encoding="utf-8") if self._spill_file is not None else None
+        try:
+            while True:
+                chunk = os.read(self._fd, 64 * 1024)
+                text = self._decoder.decode(chunk, final=not chunk)
+                if spill is not None:
+                    spill.write(text)
+                self._add(text, final=not chunk)
+                if not chunk:
+                    break
+                if self._callback is not None:
+                    self._callback()
+        finally:
+            if spill is not None:
+                spill.close()
+            self._eof = True
+            if self._callback is not None:
+                self._callback()
@@ -0,0 +1,188 @@
+# -*- encoding: utf-8 -*-
+import os
+import shutil
+import signal
+import threading
+import subprocess
+from typing import Optional, Callable
+from dataclasses import dataclass
+
+from ktest_watcher import KTestWatcher
+from klee_output import KLEEOutputReader
+from klee_stats import RunStatsReader
+
+
+@dataclass(frozen=True)
+class KLEEConfig:
+    """
+    Searcher and solver configuration of a KLEE run.
+    """
+    search: str = "dfs"  # DFS to generate test cases as fast as possible
+    solver_backend: str = "z3"
+
+    @property
+    def name(self) -> str:
+        return f"{self.search}-{self.solver_backend}".replace(":", "_")
+
+    def args(self) -> list[str]:
+        return [f"--search={self.search}", f"--solver-backend={self.solver_backend}"]
+
+
+# Time given to KLEE to write its test cases after SIGINT before it is killed
+STOP_GRACE_TIME = 10
+
+DEFAULT_KLEE_CONFIG = KLEEConfig()
+
+# Searchers good at different kinds of functions, see get_portfolio_klee_configs()
+PORTFOLIO_SEARCHERS = ["dfs", "bfs", "random-path", "nurs:covnew"]
+PORTFOLIO_SOLVER_BACKENDS = ["z3", "stp"]  # in the order of preference
+
+
+def get_klee_solver_backends() -> list[str]:
+    """
+    Get the solver backends KLEE is built with, as listed for --solver-backend by klee --help.
+    :return: names of the backends, empty if they cannot be told
+    """
+    try:
+        proc = subprocess.run(["klee", "--help"], capture_output=True, universal_newlines=True)
+    except OSError:
+        return []
+    ret = []
+    in_option = False
+    for line in proc.stdout.splitlines():
+        if "--solver-backend" in line:
+            in_option = True
+        elif in_option:
+            value = line.strip()
+            if not value.startswith("="):
+                break
+            ret.append(value[1:].split()[0])
+    return ret
+
+
+def get_portfolio_klee_configs() -> list[KLEEConfig]:
+    """
+    Get the configurations of portfolio mode: the searchers of PORTFOLIO_SEARCHERS, spread over the solvers of
+    PORTFOLIO_SOLVER_BACKENDS that KLEE is built with (on the solver of DEFAULT_KLEE_CONFIG if none of them is found).
+    """
+    available = get_klee_solver_backends()
+    backends = [backend for backend in PORTFOLIO_SOLVER_BACKENDS if backend in available]
+    if not backends:
+        backends = [DEFAULT_KLEE_CONFIG.solver_backend]
+    return [KLEEConfig(search, backends[i * len(backends) // len(PORTFOLIO_SEARCHERS)])
+            for i, search in enumerate(PORTFOLIO_SEARCHERS)]
+
+
+class KLEERun:
+    """
+    A KLEE process with its output directory, the reader of its output, the watcher of its test cases and the reader
+    of its run.stats.
+    """
+
+    def __init__(self, config: KLEEConfig, output_dir: str, label: Optional[str] = None) -> None:
+        """
+        :param config: KLEEConfig
+        :param output_dir: KLEE output directory
+        :param label: label of the run among others, or None for the name of the configuration
+        """
+        self.config = config
+        self.label = label if label is not None else config.name
+        self.output_dir = output_dir
+        self.proc: Optional[subprocess.Popen] = None
+        self.output_reader: Optional[KLEEOutputReader] = None
+        self.ktest_watcher: Optional[KTestWatcher] = None
+        self.stats_reader = RunStatsReader(output_dir)
+        self.stopped = False  # stopped by stop() or interrupt() rather than exiting by itself
+
+    def start(self, bc_filename: str, extra_args: list[str], output_max_lines: int,
+              on_new_test_cases: Optional[Callable[[], None]] = None,
+              on_new_output: Optional[Callable[[], None]] = None, log_file: Optional[str] = None) -> None:
+        """
+        Start KLEE in the background, removing the output directory of a previous run first.
+        :param bc_filename: bitcode to run
+        :param extra_args: KLEE options besides the output directory and the configuration
+        :param output_max_lines: lines of output kept in memory
+        :param on_new_test_cases: called from a background thread when new test cases are ready to be drained
+        :param on_new_output: called from a background thread when new output is ready to be read, and at its end
+        :param log_file: file to write the full KLEE output to, or None
+        """
+        if os.path.exists(self.output_dir):
+            shutil.rmtree(self.output_dir)
+
+        cmds = ["klee", f"-output-dir={self.output_dir}"] + self.config.args() + extra_args + [bc_filename]
+        try:
+            self.proc = subprocess.Popen(
+                cmds,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,  # redirect stderr to stdout
+            )
+        except Exception as e:
+            raise RuntimeError("Unable to run KLEE. Error: %s" % e)
+
+        # Read the output in the background
+        self.output_reader = KLEEOutputReader(self.proc.stdout, max_lines=output_max_lines, spill_file=log_file,
+                                              callback=on_new_output)
+        self.output_reader.start()
+
+        # Watch for test cases written by KLEE
+        self.ktest_watcher = KTestWatcher(self.output_dir, callback=on_new_test_cases)
+        self.ktest_watcher.start()
+
+    def interrupt(self, grace_time: float = STOP_GRACE_TIME) -> None:
+        """
+        Ask KLEE to halt without waiting for it. KLEE receives SIGINT, upon which it stops exploring and writes the test
+        cases of the current states. It is killed if it is still running after grace_time seconds.
+        """
+        if not self.is_running():
+            return
+        self.stopped = True
+        self.proc.send_signal(signal.SIGINT)
+        timer = threading.Timer(grace_time, self._kill_if_running)
+        timer.daemon = True
+        timer.start()
+
+    def stop(self, grace_time: float = STOP_GRACE_TIME) -> Optional[int]:
+        """
+        Stop KLEE if it is running, as interrupt() but waiting for it, and return its return code.
+        """
+        if self.proc is None:
+            return None
+        if self.proc.poll() is None:
+            self.stopped = True
+            self.proc.send_signal(signal.SIGINT)
+            try:
+                self.proc.wait(grace_time)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.proc.wait()
+        return self.proc.returncode
+
+    def _kill_if_running(self) -> None:
+        if self.is_running():
+            self.proc.kill()
+
+    def is_running(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    @property
+    def return_code(self) -> Optional[int]:
+        return self.proc.returncode if self.proc is not None else None
+
+    def drain(self, max_items: Optional[int]) -> list[str]:
+        """
+        Get the .ktest files completed since the last call. Once KLEE exits, all remaining files are returned.
+        """
+        if self.ktest_watcher is None:
+            return []
+        if self.is_running():
+            return self.ktest_watcher.drain(max_items)
+        self.ktest_watcher.finish()
+        return self.ktest_watcher.drain(until_finished=True)
+
+    def close(self) -> None:
+        """
+        Stop the background threads after KLEE has exited.
+        """
+        if self.ktest_watcher is not None:
+            self.ktest_watcher.stop()
+        self.stats_reader.close()
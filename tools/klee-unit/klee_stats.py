@@ -0,0 +1,76 @@
+# -*- encoding: utf-8 -*-
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+
+class RunStatsReader:
+    """
+    Incrementally read run.stats, the SQLite database of statistics KLEE appends a row to every --stats-write-interval
+    while it runs. Only rows added since the last read are fetched. It can be shared between threads.
+    """
+
+    def __init__(self, output_dir: str) -> None:
+        """
+        :param output_dir: KLEE output directory, which may not exist yet
+        """
+        self._filename = os.path.join(output_dir, "run.stats")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._last_rowid = 0
+        self._latest: Optional[dict] = None
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def read_new(self) -> list[dict]:
+        """
+        Get the rows added since the last call, as dicts of {column: value}. Returns an empty list if run.stats does
+        not exist yet or is locked by KLEE.
+        """
+        with self._lock:
+            return self._read_new()
+
+    def _read_new(self) -> list[dict]:
+        if self._conn is None:
+            if not os.path.exists(self._filename):
+                return []
+            try:
+                self._conn = sqlite3.connect(f"file:{self._filename}?mode=ro", uri=True, timeout=0.1,
+                                             check_same_thread=False)
+                self._conn.row_factory = sqlite3.Row
+            except sqlite3.Error:
+                return []
+
+        try:
+            rows = self._conn.execute("SELECT rowid, * FROM stats WHERE rowid > ? ORDER BY rowid",
+                                      (self._last_rowid,)).fetchall()
+        except sqlite3.Error:  # the table is not created yet, or the database is locked
+            return []
+        ret = [dict(row) for row in rows]
+        if ret:
+            self._last_rowid = ret[-1]["rowid"]
+            self._latest = ret[-1]
+        return ret
+
+    @property
+    def latest(self) -> Optional[dict]:
+        """
+        The last row read, or None.
+        """
+        return self._latest
+
+
+def instruction_coverage(row: Optional[dict]) -> float:
+    """
+    Instruction coverage in percent of a run.stats row, as ICov(%) of klee-stats.
+    """
+    if row is None:
+        return 0.0
+    covered = row.get("CoveredInstructions", 0)
+    total = covered + row.get("UncoveredInstructions", 0)
+    return 100.0 * covered / total if total > 0 else 0.0
@@ -0,0 +1,337 @@
+# -*- encoding: utf-8 -*-
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+from typing import Optional
+from dataclasses import dataclass, asdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from klee_unit_core import KLEEUnitSession, Catch2OutputMode, ArgumentDriverType
+from klee_run import KLEEConfig, get_portfolio_klee_configs
+from klee_governor import KLEEBudget
+
+# Extra time given to KLEE to flush its test cases after --max-time before it is killed
+KLEE_GRACE_TIME = 30
+POLL_INTERVAL = 0.1
+
+
+@dataclass
+class FunctionResult:
+    name: str
+    status: str  # "ok", "timeout" or "failed"
+    stage: Optional[str] = None  # pipeline stage that failed
+    message: str = ""
+    test_cases: int = 0
+    klee_test_cases: int = 0  # before minimization
+    klee_return_code: Optional[int] = None
+    stop_reason: Optional[str] = None  # why KLEE was stopped before exiting by itself
+    result_cached: bool = False  # KLEE result taken from the result cache instead of running KLEE
+    elapsed: float = 0.0
+    test_file: Optional[str] = None
+    log_file: Optional[str] = None  # with the label of each instance added if there are several
+
+
+def _get_test_file(session: KLEEUnitSession, func_name: str) -> str:
+    return os.path.join(session.tmp_dir, f"{func_name}_test.cpp")
+
+
+def _analyze_function(session: KLEEUnitSession, src_file: str, func_name: str,
+                      arg_options: Optional[dict[str, ArgumentDriverType]] = None) -> None:
+    session.set_single_file_mode()
+    session.set_src_file(src_file)
+    session.set_test_file(_get_test_file(session, func_name))
+    session.analyze_src()
+    args, _ = session.analyze_func(func_name)
+    for arg in args:
+        option = arg.options[0]  # default option, as in the GUI
+        if arg_options is not None and arg.name in arg_options:
+            option = arg_options[arg.name]
+            if option not in arg.options:
+                raise RuntimeError(f"{option.name} is not an option of argument {arg.name}")
+        session.set_arg_option(arg.name, option)
+
+
+def build_harness(src_file: str, funcs: list[str]) -> tuple[KLEEUnitSession, str]:
+    """
+    Generate the KLEE drivers of functions into one harness and compile it once. Functions whose driver cannot be
+    generated are left out, and fail on their own in run_function().
+    :param src_file: source file
+    :param funcs: functions to put into the harness
+    :return: (session owning the harness, which must be kept until KLEE is started on it, harness bitcode)
+    """
+    harness_session = None
+    entry_funcs = []
+    for func in funcs:
+        session = KLEEUnitSession()
+        try:
+            _analyze_function(session, src_file, func)
+            session.generate_test_driver()
+            session.generate_klee_driver()
+        except Exception as e:
+            print(f"{func} is left out of the harness: {e}", file=sys.stderr)
+            continue
+        entry_funcs.append(session.get_klee_entry_func())
+        if harness_session is None:
+            harness_session = session
+
+    if harness_session is None:
+        raise RuntimeError("No KLEE driver to put into the harness")
+    harness_session.generate_klee_harness(entry_funcs)
+    return_code, output = harness_session.compile_klee_driver()
+    if return_code != 0:
+        raise RuntimeError(f"harness compilation exited with {return_code}\n{output}")
+    return harness_session, harness_session.get_klee_bitcode_file()
+
+
+def run_function(src_file: str, func_name: str, output_dir: str, time_budget: float,
+                 minimize: bool = False, mode: Catch2OutputMode = Catch2OutputMode.CASES,
+                 shards: int = 1, configs: Optional[list[KLEEConfig]] = None,
+                 target_test_cases: Optional[int] = None, target_coverage: Optional[float] = None,
+                 budget: Optional[KLEEBudget] = None, partitions: int = 1,
+                 arg_options: Optional[dict[str, ArgumentDriverType]] = None,
+                 save_klee_output: bool = False, harness_bc: Optional[str] = None,
+                 use_result_cache: bool = True) -> FunctionResult:
+    """
+    Run the whole klee-unit pipeline for a function in a fresh session (and therefore a fresh temporary directory).
+    :param src_file: source file containing the function
+    :param func_name: function under test
+    :param output_dir: directory to put the generated test file and KLEE log of the function
+    :param time_budget: KLEE time budget in seconds
+    :param minimize: only translate a subset of test cases covering the same lines
+    :param mode: Catch2OutputMode of the generated test cases
+    :param shards: number of files to split the test cases into
+    :param configs: KLEE configurations to run as a portfolio, or None for the default one
+    :param target_test_cases: stop KLEE once there are this many test cases, or None
+    :param target_coverage: stop KLEE once it reaches this instruction coverage in percent, or None
+    :param budget: KLEEBudget besides the time budget, or None
+    :param partitions: number of partitions of the input domain to run in parallel
+    :param arg_options: driver options of arguments, or None to use the default option of each argument
+    :param save_klee_output: also copy the test cases and run.stats written by KLEE to the output directory
+    :param harness_bc: harness bitcode from build_harness() to run KLEE on, or None to compile the function alone
+    :param use_result_cache: take the KLEE result from the result cache if KLEE already ran on the same bitcode with
+                             the same options, and store the result otherwise
+    :return: FunctionResult
+    """
+    start_time = time.monotonic()
+    result = FunctionResult(name=func_name, status="failed")
+    func_output_dir = os.path.join(output_dir, func_name)
+    os.makedirs(func_output_dir, exist_ok=True)
+
+    stage = "session"
+    try:
+        session = KLEEUnitSession()
+        test_file = _get_test_file(session, func_name)
+
+        stage = "analyze"
+        _analyze_function(session, src_file, func_name, arg_options)
+
+        stage = "generate"
+        session.generate_test_driver()
+        session.generate_klee_driver()
+        session.partition_klee_driver(partitions)
+
+        stage = "compile"
+        if harness_bc is not None:
+            session.use_klee_harness(harness_bc)
+        else:
+            return_code, output = session.compile_klee_driver()
+            if return_code != 0:
+                raise RuntimeError(f"compilation exited with {return_code}\n{output}")
+
+        stage = "klee"
+        result.log_file = os.path.join(func_output_dir, "klee.log")
+        session.start_klee(max_time=time_budget, log_file=result.log_file, configs=configs,
+                           target_test_cases=target_test_cases, target_coverage=target_coverage, budget=budget,
+                           use_result_cache=use_result_cache, write_coverage=minimize)
+        result.result_cached = session.is_klee_result_cached()
+        deadline = time.monotonic() + time_budget + KLEE_GRACE_TIME
+        while True:
+            # Cache if still running first, in order not to lose any data if it finishes right after fetching
+            still_running = session.is_klee_running()
+            session.update_klee_test_cases()
+            if not still_running:
+                break
+            if time.monotonic() > deadline:
+                session.stop_klee()
+                result.status = "timeout"
+            time.sleep(POLL_INTERVAL)
+        result.klee_return_code = session.get_klee_return_code()
+        result.stop_reason = session.get_klee_stop_reason()
+        if save_klee_output:
+            for klee_output_dir in session.get_klee_output_dirs():
+                shutil.copytree(klee_output_dir, os.path.join(func_output_dir, os.path.basename(klee_output_dir)),
+                                ignore=shutil.ignore_patterns("*.bc", "*.ll", "*.istats"), dirs_exist_ok=True)
+
+        stage = "translate"
+        result.klee_test_cases = len(session.get_klee_test_case_store())
+        rows = session.minimize_klee_test_cases() if minimize else range(result.klee_test_cases)
+        columns = {var_name: session.format_klee_test_case_column_as_code(var_name)
+                   for var_name in session.get_watch_vars()}
+        cases = []
+        for i in rows:
+            values = {var_name: column[i] for var_name, column in columns.items()}
+            if None in values.values():
+                raise RuntimeError(f"test case {i + 1} misses some of {', '.join(values.keys())}")
+            cases.append((f"{func_name} #{i + 1}", values))
+        result.test_cases = session.generate_catch2_cases(cases, mode, shards)
+        result.test_file = os.path.join(func_output_dir, os.path.basename(test_file))
+        shard_files = session.get_catch2_shard_files(shards)
+        if shards > 1:
+            shard_files.append(session.get_catch2_shard_cmake_file())
+        for filename in shard_files:
+            shutil.copyfile(filename, os.path.join(func_output_dir, os.path.basename(filename)))
+
+        if result.status != "timeout":
+            result.status = "ok"
+        stage = None
+    except Exception as e:
+        result.status = "failed"
+        result.message = str(e)
+
+    result.stage = stage
+    result.elapsed = time.monotonic() - start_time
+    return result
+
+
+def run_batch(src_file: str, output_dir: str, funcs: Optional[list[str]] = None, jobs: Optional[int] = None,
+              time_budget: float = 60, minimize: bool = False,
+              mode: Catch2OutputMode = Catch2OutputMode.CASES, shards: int = 1,
+              configs: Optional[list[KLEEConfig]] = None, target_test_cases: Optional[int] = None,
+              target_coverage: Optional[float] = None, budget: Optional[KLEEBudget] = None,
+              partitions: int = 1, harness: bool = False, use_result_cache: bool = True) -> list[FunctionResult]:
+    """
+    Run the pipeline for functions of a source file in a bounded process pool and write report.json to output_dir.
+    :param src_file: source file
+    :param output_dir: output directory
+    :param funcs: functions to test, or None for all functions defined in the source file
+    :param jobs: maximal number of parallel jobs, or None for the number of CPUs
+    :param time_budget: KLEE time budget of each function in seconds
+    :param minimize: only translate a subset of test cases of each function covering the same lines
+    :param mode: Catch2OutputMode of the generated test cases
+    :param shards: number of files to split the test cases of each function into
+    :param configs: KLEE configurations to run as a portfolio for each function, or None for the default one
+    :param target_test_cases: stop KLEE once a function has this many test cases, or None
+    :param target_coverage: stop KLEE once it reaches this instruction coverage in percent, or None
+    :param budget: KLEEBudget of each function besides the time budget, or None
+    :param partitions: number of partitions of the input domain of each function to run in parallel
+    :param harness: compile the KLEE drivers of all functions into one harness bitcode, on which KLEE is run with the
+                    entry point of each function, instead of compiling each function apart
+    :param use_result_cache: reuse the KLEE results of functions whose bitcode and options did not change
+    :return: list of FunctionResult in the order of funcs
+    """
+    src_file = os.path.abspath(src_file)
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    if funcs is None:
+        session = KLEEUnitSession()
+        session.set_src_file(src_file)
+        session.analyze_src()
+        funcs = session.get_defined_funcs()
+
+    harness_session = None  # keeps the harness bitcode until all functions are done
+    harness_bc = None
+    if harness:
+        if partitions > 1:
+            raise RuntimeError("Partitions cannot be run from a harness")
+        try:
+            harness_session, harness_bc = build_harness(src_file, funcs)
+        except RuntimeError as e:
+            print(f"Compiling each function apart, as the harness failed: {e}", file=sys.stderr)
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(run_function, src_file, func, output_dir, time_budget, minimize, mode, shards, configs,
+                            target_test_cases, target_coverage, budget, partitions, harness_bc=harness_bc,
+                            use_result_cache=use_result_cache): func
+            for func in funcs
+        }
+        for future in as_completed(futures):
+            func = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:  # the worker itself died
+                result = FunctionResult(name=func, status="failed", stage="worker", message=str(e))
+            results[func] = result
+            print(f"[{len(results)}/{len(funcs)}] {func}: {result.status}, {result.test_cases} test cases, "
+                  f"{result.elapsed:.1f}s" + (" (cached)" if result.result_cached else ""), file=sys.stderr)
+
+    ret = [results[func] for func in funcs]
+    with open(os.path.join(output_dir, "report.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "src_file": src_file,
+            "time_budget": time_budget,
+            "minimize": minimize,
+            "mode": mode.name.lower(),
+            "shards": shards,
+            "configs": [config.name for config in configs] if configs is not None else None,
+            "budget": asdict(budget) if budget is not None else None,
+            "partitions": partitions,
+            "harness": harness_bc is not None,
+            "result_cache": use_result_cache,
+            "functions": [asdict(r) for r in ret],
+        }, f, indent=2)
+    return ret
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("src_file", help="source file under test")
+    parser.add_argument("-f", "--func", action="append", dest="funcs", metavar="name",
+                        help="function to test (can be repeated, default: all functions defined in the source file)")
+    parser.add_argument("-o", "--output-dir", default="klee-unit-out", help="output directory (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of parallel jobs (default: CPU count)")
+    parser.add_argument("-t", "--time-budget", type=float, default=60,
+                        help="KLEE time budget per function in seconds (default: %(default)s)")
+    parser.add_argument("-m", "--minimize", action="store_true",
+                        help="only translate a subset of test cases covering the same lines as all of them")
+    parser.add_argument("--table", action="store_true",
+                        help="generate a single table-driven TEST_CASE per function, which compiles much faster")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="number of files to split the test cases of each function into (default: %(default)s)")
+    parser.add_argument("--portfolio", action="store_true",
+                        help="run KLEE with several searchers and solvers in parallel and merge their test cases")
+    parser.add_argument("--target-tests", type=int, default=None,
+                        help="stop KLEE once a function has this many (distinct) test cases")
+    parser.add_argument("--target-coverage", type=float, default=None,
+                        help="stop KLEE once it reaches this instruction coverage in percent")
+    parser.add_argument("--max-instructions", type=int, default=None,
+                        help="stop KLEE after executing this many instructions")
+    parser.add_argument("--max-tests", type=int, default=None, help="stop KLEE after writing this many test cases")
+    parser.add_argument("--max-memory", type=int, default=None, metavar="MB",
+                        help="stop KLEE once it allocates this much memory")
+    parser.add_argument("--coverage-plateau", type=float, default=None, metavar="SECONDS",
+                        help="stop KLEE once it covers no new instructions for this long")
+    parser.add_argument("--partitions", type=int, default=1,
+                        help="split the domain of the first symbolic integer of each function into this many ranges, "
+                             "explored by parallel KLEE instances (default: %(default)s)")
+    parser.add_argument("--harness", action="store_true",
+                        help="compile the KLEE drivers of all functions into one bitcode and run KLEE on each of them "
+                             "with --entry-point")
+    parser.add_argument("--no-result-cache", action="store_false", dest="result_cache",
+                        help="always run KLEE, even on functions whose bitcode and options did not change since a "
+                             "cached run")
+
+
+def main(args: argparse.Namespace) -> int:
+    budget = KLEEBudget(instructions=args.max_instructions, test_cases=args.max_tests,
+                        memory=args.max_memory * 1024 * 1024 if args.max_memory is not None else None,
+                        coverage_plateau=args.coverage_plateau)
+    results = run_batch(args.src_file, args.output_dir, args.funcs, args.jobs, args.time_budget, args.minimize,
+                        Catch2OutputMode.TABLE if args.table else Catch2OutputMode.CASES, args.shards,
+                        get_portfolio_klee_configs() if args.portfolio else None, args.target_tests, args.target_coverage,
+                        budget if not budget.is_unlimited() else None, args.partitions, args.harness,
+                        args.result_cache)
+    failed = [r for r in results if r.status == "failed"]
+    for r in failed:
+        print(f"{r.name} failed at {r.stage}: {r.message}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(prog="klee-unit batch")
+    add_arguments(ap)
+    sys.exit(main(ap.parse_args()))
@@ -2,26 +2,65 @@
 import os
 import sys
 import subprocess
-from pycparser import c_parser, c_ast, c_generator, parse_file
-from typing import Optional, Callable
+import pycparser
+from pycparser import c_parser, c_ast, c_generator, parse_file, preprocess_file
+from typing import Optional, Callable, AsyncIterator, Iterable
 from enum import Enum
 from dataclasses import dataclass, field
 import tempfile
+import shutil
 import copy
-
-from ktest import KTest, KTestError
-import struct
+import re
+import hashlib
+import itertools
+
+from ktest import KTest, KTestError, KTestDirectory, write_ktest
+from disk_cache import DiskCache, KLEE_UNIT_CACHE_DIR
+from tool_discovery import get_tool_versions
+from klee_run import KLEEConfig, KLEERun, DEFAULT_KLEE_CONFIG
+from klee_stats import instruction_coverage
+from klee_governor import KLEEBudget, KLEEGovernor
+from test_minimizer import CoverageBitsets, cov_file_of, minimize
+from value_decoder import ValueType, CTypeSizes, value_type_from_c_type, format_value, format_column, \
+    format_c_literal_column
 
 CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
 KLEE_INCLUDE = os.path.join(CURRENT_DIR, "../../include")
 KLEE_UNIT_INCLUDE = os.path.join(CURRENT_DIR, "include")
 FAKE_LIBC_INCLUDE = os.path.join(CURRENT_DIR, "include/fake_libc_include")
+HARNESS_INCLUDE = os.path.join(CURRENT_DIR, "harness")  # fallback of catch.hpp for test files outside a project
 
 KLEE_HEADER_FILENAME = os.path.join(KLEE_INCLUDE, "klee/klee.h")
 KLEE_UNIT_HEADER_FILENAME = os.path.join(KLEE_UNIT_INCLUDE, "klee_unit.h")
 KLEE_DUMMY_FILENAME = os.path.join(KLEE_UNIT_INCLUDE, "klee_dummy.h")
 CATCH_DUMMY_FILENAME = os.path.join(KLEE_UNIT_INCLUDE, "catch_dummy.hpp")
 
+PARSE_CACHE_DIR = os.path.join(KLEE_UNIT_CACHE_DIR, "parse")
+CMAKE_BUILD_CACHE_DIR = os.path.join(KLEE_UNIT_CACHE_DIR, "cmake")  # build directories, reused across sessions
+BITCODE_CACHE_DIR = os.path.join(KLEE_UNIT_CACHE_DIR, "bitcode")
+OPTIMIZED_BITCODE_CACHE_DIR = os.path.join(KLEE_UNIT_CACHE_DIR, "bitcode-opt")
+RESULT_CACHE_DIR = os.path.join(KLEE_UNIT_CACHE_DIR, "results")
+
+KLEE_ENTRY_POINT_PREFIX = "klee_unit_entry_"  # KLEE drivers in a harness, see generate_klee_harness()
+
+UUT_INTERFACE_MACRO = "KLEE_UNIT_UUT_INTERFACE"  # defined when the KLEE driver is compiled apart from the source file
+
+CATCH2_VALUE_SENTINEL = "__klee_unit_value_{}__"  # placeholder of the value of a watched variable in Catch2 templates
+CATCH2_VALUE_SENTINEL_PATTERN = re.compile(r"__klee_unit_value_(\d+)__")
+
+CATCH2_SHARD_CMAKE_HEADER = "# Generated by klee-unit"  # first line of the CMake snippet of the shards
+
+# Suffix of the name of the watched output value of a variable that is also symbolic (such as PTR_IN_OUT arguments), to
+# keep it apart from the input value. A double underscore is reserved in C++, so it does not clash with a variable.
+WATCH_OUTPUT_SUFFIX = "__out"
+
+TARGET_BYTEORDER = "<"  # KLEE runs on little-endian targets
+
+
+class Catch2OutputMode(Enum):
+    CASES = 0  # a TEST_CASE with a copy of the driver for each test case
+    TABLE = 1  # a single TEST_CASE looping the driver over a static table of test cases
+
 
 class ArgumentDriverType(Enum):
     NONE = 0
@@ -59,16 +98,91 @@ class VarNotFoundError(Exception):
     pass
 
 
+class KLEEEventType(Enum):
+    OUTPUT = 0
+    TEST_CASES = 1
+    EXIT = 2
+
+
+@dataclass
+class KLEEEvent:
+    type: KLEEEventType
+    output: str = ""  # OUTPUT: new KLEE output
+    test_cases: list[dict] = field(default_factory=list)  # TEST_CASES: new test cases
+    return_code: Optional[int] = None  # EXIT: return code of KLEE
+
+
+def _scan_code(text: str, pos: int = 0) -> Iterable[tuple[int, str, int]]:
+    """
+    Iterate over the characters of C/C++ code outside comments and literals.
+    :return: (position, character, depth of brackets around the character)
+    """
+    depth = 0
+    i = pos
+    while i < len(text):
+        c = text[i]
+        if text.startswith("//", i):
+            i = text.find("\n", i)
+            if i < 0:
+                return
+            continue
+        if text.startswith("/*", i):
+            i = text.find("*/", i + 2)
+            if i < 0:
+                return
+            i += 2
+            continue
+        if c in "\"'":
+            i += 1
+            while i < len(text) and text[i] != c:
+                i += 2 if text[i] == "\\" else 1
+            i += 1
+            continue
+        if c in ")]}":
+            depth -= 1
+        yield i, c, depth
+        if c in "([{":
+            depth += 1
+        i += 1
+
+
+def _find_outside_brackets(text: str, pos: int, char: str) -> int:
+    for i, c, depth in _scan_code(text, pos):
+        if c == char and depth == 0:
+            return i
+    raise RuntimeError(f"Cannot find {char} after line {text.count(chr(10), 0, pos) + 1}")
+
+
+def _find_matching_brace(text: str, pos: int) -> int:
+    for i, c, depth in _scan_code(text, pos):
+        if c == "}" and depth == 0:
+            return i
+    raise RuntimeError(f"Cannot find the end of the block at line {text.count(chr(10), 0, pos) + 1}")
+
+
+def _split_outside_brackets(text: str, sep: str) -> list[str]:
+    ret = []
+    begin = 0
+    for i, c, depth in _scan_code(text):
+        if c == sep and depth == 0:
+            ret.append(text[begin:i])
+            begin = i + 1
+    ret.append(text[begin:])
+    return ret
+
+
 class KLEEUnitSession:
     NONE_PLACEHOLDER = "?"
+    FETCH_BATCH_SIZE = 1000  # maximal number of test cases fetched at a time while KLEE is running
+    KLEE_OUTPUT_MAX_LINES = 10000  # lines of KLEE output kept in memory
+    SEED_HISTORY_SIZE = 3  # previous KLEE starts of each function whose test cases seed the next starts
 
     def __init__(self) -> None:
         super().__init__()
 
         # Check executables
-        print(f'Found klee... {self._get_version("klee")}')
-        print(f'Found clang... {self._get_version("clang")}')
-        print(f'Found llvm-dis... {self._get_version("llvm-dis")}')
+        for executable, version in get_tool_versions().items():
+            print(f'Found {executable}... {version}')
 
         self._cmake_mode = False
         self._src_file: Optional[str] = None
@@ -78,8 +192,9 @@ class KLEEUnitSession:
         self._cmake_build_dir: Optional[str] = None
         self._tmp_test_file: Optional[str] = None
         self._klee_driver_file: Optional[str] = None
+        self._uut_interface_file: Optional[str] = None  # declarations of the source file, see _write_uut_interface()
 
-        self._parser = c_parser.CParser()
+        self._parser: Optional[c_parser.CParser] = None  # built on the first cache miss, as it takes a while
         self._generator = c_generator.CGenerator()
 
         self._src_ast: Optional[c_ast.FileAST] = None
@@ -91,18 +206,77 @@ class KLEEUnitSession:
         self._driver_ast: Optional[c_ast.FileAST] = None
         self._heading_lines = None
         self._watch_vars: Optional[list[str]] = None
-        self._test_cases: Optional[list[dict[str, bytes]]] = None
+        self._symbolic_vars: set[str] = set()  # variables made symbolic by the test driver
+        self._watch_var_types: dict[str, Optional[ValueType]] = {}
+        self._test_cases: Optional[KTestDirectory] = None  # columns of watched variables
 
         # Create a temporary directory for KLEE
         self._tmp_dir = tempfile.TemporaryDirectory()
         print("Temporary directory:", self._tmp_dir.name)
 
         self._bc_filename: Optional[str] = None
-        self._klee_output_dir: Optional[str] = None
-        self._klee_proc = None
+        self._klee_entry_point: Optional[str] = None  # function run by KLEE in harness bitcode, or None for main()
+        self._klee_driver_func: Optional[c_ast.FuncDef] = None  # rewritten for KLEE
+        self._trailing_lines: list[str] = []  # lines of the test file after the test driver
+        self._klee_partitions: list[tuple[str, str]] = []  # (driver file, bitcode file) of each partition
+        self._klee_runs: list[KLEERun] = []  # a single run, or one per configuration in portfolio mode
+        self._test_case_keys: set[tuple] = set()  # watched values of the test cases, to deduplicate across runs
+        self._klee_fetch_truncated = False  # the last update_klee_test_cases() left completed test cases behind
+        self._target_test_cases: Optional[int] = None
+        self._target_coverage: Optional[float] = None
+        self._klee_governor: Optional[KLEEGovernor] = None
+        self._klee_stop_reason: Optional[str] = None
+        # Sizes in bytes of the variables made symbolic by the KLEE driver, in order (None if unknown), which the objects
+        # of a test case must have to seed a later run
+        self._symbolic_sizes: dict[str, Optional[int]] = {}
+        self._klee_run_func_name: Optional[str] = None  # function of the runs
+        # Output directories of previous runs by function, see start_klee()
+        self._klee_result_history: dict[str, list[list[str]]] = {}
+        self._klee_seed_count = 0
+        self._klee_result_key: Optional[str] = None  # result cache key of the current runs, until their result is stored
+        self._cached_klee_result: Optional[dict] = None  # result taken from the cache instead of running KLEE
+        self._cached_test_case_count = 0  # test cases of the cached result not yet reported by update_klee_test_cases()
 
         self._driver_func_ast_copy: Optional[c_ast.FileAST] = None
 
+        # Cache of parsed source files, keyed by preprocessed content
+        self._parse_cache = DiskCache(PARSE_CACHE_DIR)
+        # Cache of the bitcode of source files, keyed by preprocessed content and compiler flags
+        self._bitcode_cache = DiskCache(BITCODE_CACHE_DIR)
+        # Cache of optimized bitcode run by KLEE, keyed by the bitcode before optimization
+        self._optimized_bitcode_cache = DiskCache(OPTIMIZED_BITCODE_CACHE_DIR)
+        # Cache of the results of complete KLEE runs, keyed by bitcode, KLEE driver and options
+        self._result_cache = DiskCache(RESULT_CACHE_DIR)
+
+    @property
+    def parse_cache(self) -> DiskCache:
+        return self._parse_cache
+
+    @property
+    def bitcode_cache(self) -> DiskCache:
+        return self._bitcode_cache
+
+    def get_cache_stats(self) -> dict[str, dict[str, int]]:
+        """
+        Get the hits and misses of the caches in this session.
+        :return: {cache name: {"hits": ..., "misses": ...}}
+        """
+        return {
+            "parse": self._parse_cache.stats(),
+            "bitcode": self._bitcode_cache.stats(),
+            "optimized_bitcode": self._optimized_bitcode_cache.stats(),
+            "results": self._result_cache.stats(),
+        }
+
+    def _get_parser(self) -> c_parser.CParser:
+        if self._parser is None:
+            self._parser = c_parser.CParser()
+        return self._parser
+
+    @property
+    def tmp_dir(self) -> str:
+        return self._tmp_dir.name
+
     def set_src_file(self, src_file: str) -> None:
         self._src_file = os.path.abspath(src_file)
 
@@ -118,37 +292,55 @@ class KLEEUnitSession:
         self._target = target
 
     @staticmethod
-    def _get_version(executable: str) -> str:
-        try:
-            version = subprocess.run([executable, "--version"], capture_output=True).stdout.decode("utf-8")
-        except FileNotFoundError as e:
-            raise RuntimeError(f"{executable} is not found in the system") from e
-        return version.splitlines(keepends=False)[0]
+    def _get_cmake_generator() -> str:
+        return "Ninja" if shutil.which("ninja") is not None else "Unix Makefiles"
 
-    def run_cmake(self) -> (int, str):
+    def run_cmake(self, reconfigure: bool = False) -> (int, str):
+        """
+        Configure the project with wllvm. The build directory is kept under the cache directory, keyed by the project,
+        the generator and the flags, so that later sessions only rebuild what changed. A configured build directory is
+        not configured again (the build tool reruns CMake itself when CMakeLists.txt changes) unless reconfigure is set.
+        :return: (exit code, cmake output)
+        """
         if self._project_dir is None:
             raise RuntimeError("Project directory is not set")
 
-        self._cmake_build_dir = os.path.join(self._tmp_dir.name, "build_klee_unit")
+        flags = f"'-include \"{CATCH_DUMMY_FILENAME}\" -include \"{KLEE_UNIT_HEADER_FILENAME}\" -include \"{KLEE_HEADER_FILENAME}\"'"
+        env = {
+            "CC": "wllvm",
+            "CXX": "wllvm++",
+            "WLLVM_CONFIGURE_ONLY": "1",
+            "LLVM_COMPILER": "clang",
+        }
+        generator = self._get_cmake_generator()
+        key = DiskCache.make_key(self._project_dir, generator, flags, sorted(f"{k}={v}" for k, v in env.items()))
+        self._cmake_build_dir = os.path.join(CMAKE_BUILD_CACHE_DIR,
+                                             f"{os.path.basename(self._project_dir)}-{key[:16]}")
         if not os.path.exists(self._cmake_build_dir):
             os.makedirs(self._cmake_build_dir, exist_ok=True)
 
+        if not reconfigure and os.path.exists(os.path.join(self._cmake_build_dir, "CMakeCache.txt")):
+            return 0, f"-- Reusing the build directory {self._cmake_build_dir}\n"
+
         cmds = ["cmake",
-                f"-DCMAKE_C_FLAGS='-include \"{CATCH_DUMMY_FILENAME}\" -include \"{KLEE_UNIT_HEADER_FILENAME}\" -include \"{KLEE_HEADER_FILENAME}\"'",
-                f"-DCMAKE_CXX_FLAGS='-include \"{CATCH_DUMMY_FILENAME}\" -include \"{KLEE_UNIT_HEADER_FILENAME}\" -include \"{KLEE_HEADER_FILENAME}\"'",
+                "-G", generator,
+                f"-DCMAKE_C_FLAGS={flags}",
+                f"-DCMAKE_CXX_FLAGS={flags}",
                 self._project_dir]
         proc = subprocess.run(
             cmds,
             cwd=self._cmake_build_dir,
-            env=dict(os.environ, **{
-                "CC": "wllvm",
-                "CXX": "wllvm++",
-                "WLLVM_CONFIGURE_ONLY": "1",
-                "LLVM_COMPILER": "clang",
-            }),
+            env=dict(os.environ, **env),
             capture_output=True,
             universal_newlines=True)
 
+        if proc.returncode != 0:
+            # Do not reuse a half-configured build directory
+            try:
+                os.unlink(os.path.join(self._cmake_build_dir, "CMakeCache.txt"))
+            except FileNotFoundError:
+                pass
+
         return proc.returncode, "+ " + " ".join(cmds) + "\n" + proc.stdout
 
     def analyze_src(self) -> dict[str, str]:
@@ -165,10 +357,20 @@ class KLEEUnitSession:
         if not os.path.exists(self._src_file):
             raise RuntimeError(f"Source file {self._src_file} does not exist")
 
-        self._src_ast = parse_file(self._src_file, use_cpp=True, cpp_args=[
+        cpp_args = [
             # '-xc++',
             f'-I{FAKE_LIBC_INCLUDE}',
-        ], parser=self._parser)
+        ]
+        src_text = preprocess_file(self._src_file, cpp_args=cpp_args)
+
+        # Unchanged preprocessed content gives the same AST, so look it up in the cache first
+        cache_key = DiskCache.make_key(pycparser.__version__, self._src_file, cpp_args, src_text)
+        cached = self._parse_cache.load(cache_key)
+        if cached is not None:
+            self._src_ast, ret, self._func_decls = cached
+            return dict(ret)
+
+        self._src_ast = self._get_parser().parse(src_text, self._src_file)
 
         # self._src_ast.show()
 
@@ -191,7 +393,19 @@ class KLEEUnitSession:
         self._func_decls = {}
         v = _FuncDefVisitor(ret, self._func_decls, self._generator)
         v.visit(self._src_ast)
-        return ret
+
+        # Pickled together so that the decls still point into the AST
+        self._parse_cache.store(cache_key, (self._src_ast, ret, self._func_decls))
+        return dict(ret)
+
+    def get_defined_funcs(self) -> list[str]:
+        """
+        Get the functions defined (not only declared) in the source file.
+        :return: list of function names in the order of definition
+        """
+        if self._src_ast is None:
+            raise RuntimeError("analyze_src is required before get_defined_funcs")
+        return [e.decl.name for e in self._src_ast.ext if type(e) is c_ast.FuncDef]
 
     def analyze_func(self, name: str) -> (list[ArgumentInfo], bool):
         """
@@ -451,13 +665,15 @@ class KLEEUnitSession:
             assert type(cast.expr) is c_ast.UnaryOp and cast.expr.op == "&" and type(cast.expr.expr) is c_ast.ID
             var_name = cast.expr.expr.name
 
+            watch_name = self._get_watch_name(var_name)
+
             # Rewrite the function call
             e.name.name = "klee_watch_obj"
             e.args.exprs = [c_ast.UnaryOp(op="&", expr=c_ast.ID(var_name)),
-                            c_ast.Constant(type="string", value=f'"{var_name}"')]
+                            c_ast.Constant(type="string", value=f'"{watch_name}"')]
             ret = [e]
 
-            self._watch_vars.append(var_name)
+            self._watch_vars.append(watch_name)
         elif self._is_let_call(e):
             assert len(e.args.exprs) == 1
 
@@ -469,6 +685,12 @@ class KLEEUnitSession:
 
         return ret
 
+    def _get_watch_name(self, var_name: str) -> str:
+        """
+        Get the name a variable is watched under, see WATCH_OUTPUT_SUFFIX.
+        """
+        return var_name + WATCH_OUTPUT_SUFFIX if var_name in self._symbolic_vars else var_name
+
     @staticmethod
     def _is_symbolic_call(e) -> bool:
         if type(e) is c_ast.Decl:
@@ -509,10 +731,11 @@ class KLEEUnitSession:
                                       cpp_args=[
                                           f"-I{KLEE_UNIT_INCLUDE}",
                                           f"-I{FAKE_LIBC_INCLUDE}",
+                                          f"-I{HARNESS_INCLUDE}",
                                           f"-include{CATCH_DUMMY_FILENAME}",
                                           f"-include{KLEE_UNIT_HEADER_FILENAME}",
                                       ],
-                                      parser=self._parser)  # substitute the macros
+                                      parser=self._get_parser())  # substitute the macros
 
         # Lookup the function
         driver_func, start_line, end_line = self._lookup_test_driver_func(self._driver_ast)
@@ -538,70 +761,397 @@ class KLEEUnitSession:
         driver_func.decl.name = "main"
         driver_func.decl.type.type.declname = "main"
         driver_func.decl.type.type.type.names = ["int"]
+        self._symbolic_vars = {e.name for e in driver_func.body.block_items if self._is_symbolic_call(e)}
         new_body = []
         for e in driver_func.body.block_items:
             new_body.extend(self._rewrite_statement_to_klee(e))  # change self._watch_vars inside
         driver_func.body.block_items = new_body
         # driver_func.show()
 
+        # Types to decode the watched variables with
+        decl_types = {e.name: e.type for e in new_body if type(e) is c_ast.Decl}
+        self._watch_var_types = {var: value_type_from_c_type(decl_types.get(var.removesuffix(WATCH_OUTPUT_SUFFIX)),
+                                                             TARGET_BYTEORDER)
+                                 for var in self._watch_vars}
+
         # Generate KLEE test driver source code
         klee_driver_src = self._generator.visit(driver_func)
+        self._klee_driver_func = driver_func
+        # FIXME: if there is nothing in the AST after the driver, everything will be overwritten
+        self._trailing_lines = lines[end_line:] if end_line is not None else []
+        self._klee_partitions = []
+        self._klee_entry_point = None
+        type_sizes = CTypeSizes(self._driver_ast, skip_dirs=(FAKE_LIBC_INCLUDE,))
+        self._symbolic_sizes = {name: type_sizes.evaluate(e.args.exprs[1]) for e in new_body
+                                if (name := self._get_symbolic_var_name(e)) is not None}
 
         if not self._cmake_mode:
             # Replace the test driver function with KLEE test driver function
             self._klee_driver_file = os.path.join(self._tmp_dir.name, "klee_" + os.path.basename(self._test_file))
-            with open(self._klee_driver_file, "w", encoding="utf-8") as f:
-                if self._heading_lines is not None:
-                    f.writelines(self._heading_lines)
-                f.write(f'#include <klee/klee.h>\n')
-                f.write(f'#include "{os.path.abspath(self._src_file)}"\n\n')
-                f.write(klee_driver_src)
-                f.write('void *__symbolic(unsigned long s) { (void) s; return 0; }\n')
-                f.write('void __watch(void *ptr) { (void) ptr; }\n')
-                f.write('void __let(int cond) { (void) cond; }\n')
-                # FIXME: if there is nothing in the AST after the driver, everything will be overwritten
-                if end_line is not None:
-                    f.writelines(lines[end_line:])
+            self._uut_interface_file = self._write_uut_interface(driver_func)
+            self._write_klee_driver_file(self._klee_driver_file, klee_driver_src)
 
         else:
             # Replace the test driver in place
             self._klee_driver_file = self._test_file
-            with open(self._klee_driver_file, "w", encoding="utf-8") as f:
-                if self._heading_lines is not None:
-                    f.writelines(self._heading_lines)
-                f.write(f'#include "{KLEE_DUMMY_FILENAME}"\n')
-                f.write(klee_driver_src)
-                # FIXME: if there is nothing in the AST after the driver, everything will be overwritten
-                if end_line is not None:
-                    f.writelines(lines[end_line:])
+            self._write_cmake_klee_driver_file(klee_driver_src)
 
         return self._watch_vars
 
+    def _write_cmake_klee_driver_file(self, klee_driver_src: str) -> None:
+        with open(self._klee_driver_file, "w", encoding="utf-8") as f:
+            if self._heading_lines is not None:
+                f.writelines(self._heading_lines)
+            f.write(f'#include "{KLEE_DUMMY_FILENAME}"\n')
+            f.write(klee_driver_src)
+            f.writelines(self._trailing_lines)
+
+    def _write_klee_driver_file(self, filename: str, klee_driver_src: str) -> None:
+        with open(filename, "w", encoding="utf-8") as f:
+            if self._heading_lines is not None:
+                f.writelines(self._heading_lines)
+            f.write(f'#include <klee/klee.h>\n')
+            if self._uut_interface_file is not None:
+                # The source file is compiled on its own and linked, unless that fails, see compile_klee_driver()
+                f.write(f'#ifdef {UUT_INTERFACE_MACRO}\n')
+                # Relative to the driver, so that the driver does not depend on the session, see _compile_klee_driver_file()
+                f.write(f'#include "{os.path.relpath(self._uut_interface_file, os.path.dirname(filename))}"\n')
+                f.write(f'#else\n')
+                f.write(f'#include "{os.path.abspath(self._src_file)}"\n')
+                f.write(f'#endif\n\n')
+            else:
+                f.write(f'#include "{os.path.abspath(self._src_file)}"\n\n')
+            f.write(klee_driver_src)
+            f.write('void *__symbolic(unsigned long s) { (void) s; return 0; }\n')
+            f.write('void __watch(void *ptr) { (void) ptr; }\n')
+            f.write('void __let(int cond) { (void) cond; }\n')
+            f.writelines(self._trailing_lines)
+
+    @staticmethod
+    def _is_const_object(type_node) -> bool:
+        while type(type_node) is c_ast.ArrayDecl:
+            type_node = type_node.type
+        return type(type_node) is c_ast.TypeDecl and "const" in type_node.quals
+
+    def _write_uut_interface(self, driver_func: c_ast.FuncDef) -> Optional[str]:
+        """
+        Write a header declaring what the source file defines: its preprocessor directives (for the macros and the
+        headers it includes), followed by its types, function prototypes and global variables as extern, so that the
+        KLEE driver can be compiled apart from the source file.
+        :param driver_func: KLEE driver function
+        :return: the header, or None if the driver uses static or inline functions or variables of the source file,
+                 which can only be reached by including it
+        """
+        if self._src_ast is None:
+            return None
+
+        internal = set()  # names that cannot be linked to from another translation unit
+        decls = []
+        for node in self._src_ast.ext:
+            if node.coord is None or os.path.abspath(node.coord.file) != self._src_file:
+                continue  # declared by an included header
+            if type(node) is c_ast.FuncDef:
+                node = node.decl
+            if type(node) is c_ast.Decl and node.name is not None:
+                if "static" in node.storage or "inline" in node.funcspec:
+                    internal.add(node.name)
+                    continue
+                if type(node.type) is not c_ast.FuncDecl and "extern" not in node.storage:
+                    if self._is_const_object(node.type):  # internal linkage in C++
+                        internal.add(node.name)
+                        continue
+                    node = copy.copy(node)
+                    node.storage = ["extern"]
+                    node.init = None
+            if type(node) in (c_ast.Decl, c_ast.Typedef):
+                decls.append(self._generator.visit(node) + ";\n")
+
+        class _IDVisitor(c_ast.NodeVisitor):
+
+            def __init__(self) -> None:
+                super().__init__()
+                self.names = set()
+
+            def visit_ID(self, node: c_ast.ID):
+                self.names.add(node.name)
+
+        visitor = _IDVisitor()
+        visitor.visit(driver_func)
+        if visitor.names & internal:
+            return None
+
+        # Directives, including their continuation lines
+        with open(self._src_file, "r", encoding="utf-8") as f:
+            src_lines = f.readlines()
+        directives = []
+        continued = False
+        for line in src_lines:
+            if continued or line.lstrip().startswith("#"):
+                directives.append(line if line.endswith("\n") else line + "\n")
+                continued = line.rstrip("\r\n").endswith("\\")
+
+        interface_file = os.path.join(self._tmp_dir.name, "uut_interface.h")
+        with open(interface_file, "w", encoding="utf-8") as f:
+            f.write(f"/* Declarations of {self._src_file} */\n")
+            f.writelines(directives)
+            f.write("\n")
+            f.writelines(decls)
+        return interface_file
+
+    @staticmethod
+    def _get_symbolic_var_name(e) -> Optional[str]:
+        """
+        Get the variable made symbolic by a statement of the KLEE driver, or None.
+        """
+        if type(e) is c_ast.FuncCall and type(e.name) is c_ast.ID and e.name.name == "klee_make_symbolic":
+            return e.args.exprs[-1].value.strip('"')
+        return None
+
+    @staticmethod
+    def _split_int_range(value_type: ValueType, partitions: int) -> list[tuple[Optional[int], Optional[int]]]:
+        """
+        Split the range of an integer type into contiguous ranges of about the same size.
+        :return: (lowest, highest) of each range, None for the edges of the type
+        """
+        bits = value_type.size * 8
+        lo, hi = (0, (1 << bits) - 1) if value_type.kind == "u" else (-(1 << (bits - 1)), (1 << (bits - 1)) - 1)
+        size = hi - lo + 1
+        partitions = min(partitions, size)
+        bounds = [lo + size * k // partitions for k in range(partitions + 1)]
+        return [(bounds[k] if k > 0 else None, bounds[k + 1] - 1 if k < partitions - 1 else None)
+                for k in range(partitions)]
+
+    @staticmethod
+    def _int_literal(value: int, value_type: ValueType) -> c_ast.Node:
+        suffix = ("U" if value_type.kind == "u" else "") + ("LL" if value_type.size > 4 else "")
+        literal = c_ast.Constant(type="int", value=f"{abs(value)}{suffix}")
+        return c_ast.UnaryOp(op="-", expr=literal) if value < 0 else literal
+
+    def partition_klee_driver(self, partitions: int) -> Optional[str]:
+        """
+        Split the input domain of the first symbolic integer variable of the KLEE driver into disjoint ranges, and
+        write a KLEE driver per range, constraining the variable with an extra LET(). compile_klee_driver() and
+        start_klee() then compile and run all of them, and the test cases of the partitions are merged. Only for
+        single-file mode, after generate_klee_driver().
+        :param partitions: number of partitions, 1 to run the KLEE driver as it is
+        :return: the partitioned variable, or None if the driver is not partitioned
+        """
+        if self._klee_driver_func is None:
+            raise RuntimeError("Generate KLEE driver before partitioning it")
+        if self._cmake_mode:
+            raise RuntimeError("Partitioning the KLEE driver is only supported in single-file mode")
+
+        self._klee_partitions = []
+        if partitions <= 1:
+            return None
+
+        # The first symbolic variable of an integer type
+        var_name = None
+        for e in self._klee_driver_func.body.block_items:
+            name = self._get_symbolic_var_name(e)
+            value_type = self.get_watch_var_type(name) if name is not None else None
+            if value_type is not None and value_type.kind in ("i", "u") and value_type.count is None:
+                var_name = name
+                break
+        if var_name is None:
+            return None
+
+        stem, ext = os.path.splitext(os.path.basename(self._test_file))
+        for k, (lo, hi) in enumerate(self._split_int_range(value_type, partitions)):
+            # lo <= var && var <= hi, with & so that KLEE does not fork on the constraint
+            conds = []
+            if lo is not None:
+                conds.append(c_ast.BinaryOp(op=">=", left=c_ast.ID(var_name), right=self._int_literal(lo, value_type)))
+            if hi is not None:
+                conds.append(c_ast.BinaryOp(op="<=", left=c_ast.ID(var_name), right=self._int_literal(hi, value_type)))
+            cond = conds[0] if len(conds) == 1 else c_ast.BinaryOp(op="&", left=conds[0], right=conds[1])
+            let_call = c_ast.FuncCall(name=c_ast.ID("__let"), args=c_ast.ExprList([cond]))
+
+            func = copy.deepcopy(self._klee_driver_func)
+            body = func.body.block_items
+            index = next(i for i, e in enumerate(body) if self._get_symbolic_var_name(e) == var_name)
+            body[index + 1:index + 1] = self._rewrite_statement_to_klee(let_call)
+
+            driver_file = os.path.join(self._tmp_dir.name, f"klee_{stem}_part{k}{ext}")
+            self._write_klee_driver_file(driver_file, self._generator.visit(func))
+            self._klee_partitions.append((driver_file, os.path.splitext(driver_file)[0] + ".bc"))
+        return var_name
+
+    def get_klee_partition_count(self) -> int:
+        return max(len(self._klee_partitions), 1)
+
+    def get_klee_entry_point(self) -> str:
+        """
+        Name of the KLEE driver of the current function in a harness.
+        """
+        return KLEE_ENTRY_POINT_PREFIX + self._current_func_name
+
+    def get_klee_entry_func(self) -> c_ast.FuncDef:
+        """
+        Get the KLEE driver renamed to get_klee_entry_point(), to be put into a harness with the drivers of other
+        functions. Call after generate_klee_driver().
+        """
+        if self._klee_driver_func is None:
+            raise RuntimeError("Generate KLEE driver before putting it into a harness")
+        func = copy.deepcopy(self._klee_driver_func)
+        func.decl.name = self.get_klee_entry_point()
+        func.decl.type.type.declname = func.decl.name
+        func.decl.type.type.type.names = ["void"]  # as the test driver, only main() may omit its return value
+        return func
+
+    def generate_klee_harness(self, entry_funcs: list[c_ast.FuncDef]) -> str:
+        """
+        Write the KLEE drivers of several functions of the source file (from get_klee_entry_func() of their sessions)
+        into one harness, in place of the KLEE driver of this session. compile_klee_driver() then compiles all of them
+        at once, and each session runs KLEE on its own entry point of the bitcode after use_klee_harness(). Call after
+        generate_klee_driver().
+        :param entry_funcs: KLEE drivers renamed to their entry points
+        :return: harness file
+        """
+        if self._klee_driver_func is None:
+            raise RuntimeError("Generate KLEE driver before generating a harness")
+        if len({func.decl.name for func in entry_funcs}) != len(entry_funcs):
+            raise RuntimeError("Entry points of the harness are duplicated")
+
+        # KLEE looks up --entry-point by its symbol, which must not be mangled if the harness is compiled as C++
+        harness_src = ('#ifdef __cplusplus\nextern "C" {\n#endif\n\n' +
+                       "\n".join(self._generator.visit(func) for func in entry_funcs) +
+                       '\n#ifdef __cplusplus\n}\n#endif\n')
+        self._klee_partitions = []
+        if not self._cmake_mode:
+            ext = os.path.splitext(self._test_file)[1]
+            self._klee_driver_file = os.path.join(self._tmp_dir.name, f"klee_unit_harness{ext}")
+            self._uut_interface_file = self._write_uut_interface(c_ast.FileAST(entry_funcs))
+            self._write_klee_driver_file(self._klee_driver_file, harness_src)
+        else:
+            # KLEE is run with --entry-point, main() only stands in for the KLEE driver to link the target
+            self._write_cmake_klee_driver_file(harness_src + "\nint main() { return 0; }\n")
+        return self._klee_driver_file
+
+    def get_klee_bitcode_file(self) -> Optional[str]:
+        """
+        Bitcode compiled by compile_klee_driver(), or None.
+        """
+        return self._bc_filename
+
+    def use_klee_harness(self, bc_filename: str) -> None:
+        """
+        Run KLEE on get_klee_entry_point() of harness bitcode compiled by another session (see generate_klee_harness())
+        instead of compiling the KLEE driver of this session. Call after generate_klee_driver().
+        :param bc_filename: harness bitcode, which must be kept until KLEE is started
+        """
+        self._bc_filename = bc_filename
+        self._klee_entry_point = self.get_klee_entry_point()
+        self._klee_partitions = []
+
+    def _get_driver_language(self) -> str:
+        # The source file is compiled in the language of the KLEE driver, as it is when the driver includes it
+        return "c" if os.path.splitext(self._klee_driver_file)[1] == ".c" else "c++"
+
+    def _compile_uut(self) -> Optional[str]:
+        """
+        Compile the source file alone to bitcode, or take it from the cache if neither its preprocessed content nor
+        the flags changed.
+        :return: bitcode file, or None if the source file cannot be compiled alone
+        """
+        if self._uut_interface_file is None or shutil.which("llvm-link") is None:
+            return None
+
+        args = ["-x", self._get_driver_language(), "-I", KLEE_INCLUDE, "-I", KLEE_UNIT_INCLUDE, "-g", "-O0"]
+        preprocess_proc = subprocess.run(["clang", "-E"] + args + [self._src_file], capture_output=True)
+        if preprocess_proc.returncode != 0:
+            return None
+        # Line markers in the preprocessed content also key the path of the source file (part of the debug info)
+        key = DiskCache.make_key(get_tool_versions(["clang"])["clang"], args, preprocess_proc.stdout)
+
+        bc_filename = os.path.join(self._tmp_dir.name, "uut.bc")
+        data = self._bitcode_cache.get(key)
+        if data is not None:
+            with open(bc_filename, "wb") as f:
+                f.write(data)
+            return bc_filename
+
+        proc = subprocess.run(["clang"] + args + ["-emit-llvm", "-c", self._src_file, "-o", bc_filename],
+                              capture_output=True)
+        if proc.returncode != 0:
+            return None
+        self._bitcode_cache.put_file(key, bc_filename)
+        return bc_filename
+
+    def _compile_klee_driver_file(self, driver_file: str, bc_filename: str,
+                                  uut_bc_filename: Optional[str] = None) -> subprocess.CompletedProcess:
+        """
+        Compile a KLEE driver to bitcode.
+        :param driver_file: KLEE driver
+        :param bc_filename: output bitcode
+        :param uut_bc_filename: bitcode of the source file to link the driver with, or None to compile the source file
+                                as part of the driver
+        """
+        cmds = ["clang",
+                "-I", KLEE_INCLUDE,
+                "-I", KLEE_UNIT_INCLUDE,
+                "-I", HARNESS_INCLUDE,
+                "-include", CATCH_DUMMY_FILENAME,
+                "-include", KLEE_DUMMY_FILENAME,
+                "-emit-llvm", "-c", "-g", "-O0",
+                # Compiled from the temporary directory with its path mapped away, so that the bitcode of the same
+                # driver is the same in every session, for the result cache (see _make_klee_result_key())
+                f"-ffile-prefix-map={self._tmp_dir.name}=."]
+        driver_file = os.path.relpath(driver_file, self._tmp_dir.name)
+        if uut_bc_filename is None:
+            return subprocess.run(
+                cmds + [driver_file, "-o", bc_filename],
+                cwd=self._tmp_dir.name,
+                capture_output=True,
+                universal_newlines=True)
+
+        driver_bc_filename = os.path.splitext(bc_filename)[0] + ".driver.bc"
+        proc = subprocess.run(
+            cmds + [f"-D{UUT_INTERFACE_MACRO}",
+                    "-iquote", os.path.dirname(self._src_file),  # for the headers the interface includes
+                    driver_file, "-o", driver_bc_filename],
+            cwd=self._tmp_dir.name,
+            capture_output=True,
+            universal_newlines=True)
+        if proc.returncode != 0:
+            return proc
+        return subprocess.run(
+            ["llvm-link", driver_bc_filename, uut_bc_filename, "-o", bc_filename],
+            capture_output=True,
+            universal_newlines=True)
+
     def compile_klee_driver(self) -> (int, str):
         """
-        Compile KLEE driver file.
+        Compile KLEE driver file. In single-file mode, the source file is compiled on its own (or taken from the
+        bitcode cache) and linked with the driver with llvm-link, so that editing the driver only recompiles the
+        driver. If that fails, the driver is compiled with the source file included, as a whole.
         :return: (clang output, exit code)
         """
         if not self._cmake_mode:
             # Generate LLVM bitcode with clang
             self._bc_filename = os.path.splitext(self._klee_driver_file)[0] + ".bc"
-            proc = subprocess.run(
-                ["clang",
-                 "-I", KLEE_INCLUDE,
-                 "-I", KLEE_UNIT_INCLUDE,
-                 "-include", CATCH_DUMMY_FILENAME,
-                 "-include", KLEE_DUMMY_FILENAME,
-                 "-emit-llvm", "-c", "-g", "-O0", self._klee_driver_file,
-                 "-o", self._bc_filename],
-                capture_output=True,
-                universal_newlines=True)
+            uut_bc_filename = self._compile_uut()
+            proc = self._compile_klee_driver_file(self._klee_driver_file, self._bc_filename, uut_bc_filename)
+            if proc.returncode != 0 and uut_bc_filename is not None:
+                # The driver may need more of the source file than the interface declares
+                uut_bc_filename = None
+                proc = self._compile_klee_driver_file(self._klee_driver_file, self._bc_filename)
+            if proc.returncode != 0:
+                return proc.returncode, proc.stdout
+
+            # Partitions of the driver, see partition_klee_driver()
+            for driver_file, bc_filename in self._klee_partitions:
+                partition_proc = self._compile_klee_driver_file(driver_file, bc_filename, uut_bc_filename)
+                if partition_proc.returncode != 0:
+                    return partition_proc.returncode, partition_proc.stdout
 
             return proc.returncode, proc.stdout
 
         else:
-            # Generate LLVM bitcode with wllvm
+            # Generate LLVM bitcode with wllvm. Only the objects changed since the last build (usually just the test
+            # file) are rebuilt, as the build directory is kept across sessions.
             make_proc = subprocess.run(
-                ["make", f"{self._target}"],
+                ["cmake", "--build", ".", "--target", self._target, "--parallel", str(os.cpu_count() or 1)],
                 cwd=self._cmake_build_dir,
                 env=dict(os.environ, **{
                     "LLVM_COMPILER": "clang",
@@ -629,110 +1179,593 @@ class KLEEUnitSession:
             # extract-bc does not output anything, so just return the return code
             return extract_bc_proc.returncode, make_proc.stdout
 
-    def start_klee(self):
-        self._klee_output_dir = os.path.join(self._tmp_dir.name, f"klee-out-{self._current_func_name}")
-        if os.path.exists(self._klee_output_dir):
-            os.system(f"rm -rf {self._klee_output_dir}")
+    def _optimize_bitcode(self, bc_filename: str) -> Optional[str]:
+        """
+        Optimize bitcode with opt -O2 as KLEE does with --optimize, or take it from the cache if the same bitcode was
+        optimized before.
+        :return: optimized bitcode, or None if it cannot be optimized (KLEE should then optimize it itself)
+        """
+        if shutil.which("opt") is None or shutil.which("llvm-extract") is None:
+            return None
+
+        # The stubs of klee_dummy.h must become declarations first, or opt drops the calls to them, as they do
+        # nothing. KLEE handles the declarations. Other functions named klee_*, such as the entry points of a harness,
+        # are kept.
+        with open(KLEE_DUMMY_FILENAME, encoding="utf-8") as f:
+            stubs = re.findall(r"^NO_OPT\b.*?\b(klee_\w+)\s*\(", f.read(), re.MULTILINE)
+        stub_regex = "^({})$".format("|".join(stubs))
+
+        with open(bc_filename, "rb") as f:
+            key = DiskCache.make_key("-O2", get_tool_versions(["opt"])["opt"], stub_regex, f.read())
+        # In this session's directory, as the bitcode may be a harness shared with other sessions
+        stem = os.path.join(self._tmp_dir.name, os.path.splitext(os.path.basename(bc_filename))[0])
+        opt_bc_filename = stem + ".opt.bc"
+        data = self._optimized_bitcode_cache.get(key)
+        if data is not None:
+            with open(opt_bc_filename, "wb") as f:
+                f.write(data)
+            return opt_bc_filename
+
+        stubless_bc_filename = stem + ".stubless.bc"
+        proc = subprocess.run(["llvm-extract", "--delete", f"--rfunc={stub_regex}", bc_filename, "-o", stubless_bc_filename],
+                              capture_output=True)
+        if proc.returncode != 0:
+            return None
+        proc = subprocess.run(["opt", "-O2", stubless_bc_filename, "-o", opt_bc_filename], capture_output=True)
+        if proc.returncode != 0:
+            return None
+        self._optimized_bitcode_cache.put_file(key, opt_bc_filename)
+        return opt_bc_filename
+
+    def _keep_klee_results(self) -> None:
+        """
+        Move the output directories of the last KLEE runs aside, so that their test cases can seed the next runs of the
+        same function. Only the last SEED_HISTORY_SIZE starts of each function are kept.
+        """
+        output_dirs = self.get_klee_output_dirs()
+        if not output_dirs or self._klee_run_func_name is None:
+            return
+        func_name = self._klee_run_func_name
+        kept_dirs = []
+        for output_dir in output_dirs:
+            if os.path.isdir(output_dir):
+                kept_dir = tempfile.mkdtemp(prefix=f"klee-prev-{func_name}-", dir=self._tmp_dir.name)
+                os.replace(output_dir, kept_dir)
+                kept_dirs.append(kept_dir)
+
+        history = self._klee_result_history.setdefault(func_name, [])
+        history.append(kept_dirs)
+        while len(history) > self.SEED_HISTORY_SIZE:
+            old_dirs = history.pop(0)
+            for old_dir in old_dirs:
+                shutil.rmtree(old_dir, ignore_errors=True)
+
+    def _make_klee_seeds(self) -> Optional[str]:
+        """
+        Collect the test cases of previous runs of the current function that are compatible with the current KLEE
+        driver, i.e. that have an object of the same size for every variable the driver makes symbolic, as KLEE stops
+        the states whose seeds have objects of another size. They are rewritten with only the symbolic objects, in the
+        order of the driver, and deduplicated.
+        :return: seed directory for --seed-dir, or None if there is no seed
+        """
+        self._klee_seed_count = 0
+        names = list(self._symbolic_sizes)
+        history = self._klee_result_history.get(self._current_func_name)
+        if not names or not history:
+            return None
+        if None in self._symbolic_sizes.values():
+            return None  # the test cases cannot be checked against the driver
+
+        seed_dir = os.path.join(self._tmp_dir.name, f"klee-seeds-{self._current_func_name}")
+        if os.path.exists(seed_dir):
+            shutil.rmtree(seed_dir)
+        os.makedirs(seed_dir)
+
+        seeds = set()
+        for kept_dirs in reversed(history):  # most recent first
+            for kept_dir in kept_dirs:
+                for filename in sorted(f for f in os.listdir(kept_dir) if f.endswith(".ktest")):
+                    try:
+                        with KTest.fromfile(os.path.join(kept_dir, filename)) as ktest:
+                            values = dict(ktest.objects)  # keep the last object of duplicated names
+                    except KTestError:
+                        continue
+                    if any(len(values.get(name, b"")) != size for name, size in self._symbolic_sizes.items()):
+                        continue  # terminated before making all variables symbolic, or of an older driver
+                    seed = tuple(values[name] for name in names)
+                    if seed in seeds:
+                        continue
+                    seeds.add(seed)
+                    write_ktest(os.path.join(seed_dir, f"seed{len(seeds):06d}.ktest"), list(zip(names, seed)))
+
+        self._klee_seed_count = len(seeds)
+        return seed_dir if seeds else None
+
+    def get_klee_seed_count(self) -> int:
+        """
+        Number of test cases of previous runs that seeded the current run.
+        """
+        return self._klee_seed_count
 
-        # Run KLEE
-        self._test_cases = []
+    def _make_klee_result_key(self, bc_filenames: list[str], configs: list[KLEEConfig], args: list[str],
+                              budget: Optional[KLEEBudget]) -> str:
+        """
+        Make the result cache key of KLEE runs: the content of the bitcode files, the KLEE driver, the watched variables,
+        the KLEE version and all options that change what KLEE explores or when it is stopped.
+        """
+        bc_hashes = []
+        for bc_filename in bc_filenames:
+            with open(bc_filename, "rb") as f:
+                bc_hashes.append(hashlib.sha256(f.read()).hexdigest())
+        return DiskCache.make_key("klee-result", get_tool_versions(["klee"])["klee"], bc_hashes,
+                                  self._generator.visit(self._klee_driver_func), self._watch_vars,
+                                  [repr(config) for config in configs], args,
+                                  repr((self._target_test_cases, self._target_coverage, budget)))
+
+    def _store_klee_result(self) -> None:
+        """
+        Store the test cases (with their .cov files), the table of watched variables and the last run.stats rows of
+        the finished runs under self._klee_result_key.
+        """
+        files = []
         try:
-            # Use of universal_newlines to treat all newlines as \n for Python's purpose
-            self._klee_proc = subprocess.Popen(
-                ["klee",
-                 "--search=dfs",  # DFS to generate test cases as fast as possible
-                 f"-output-dir={self._klee_output_dir}",
-                 "--optimize",
-                 "--solver-backend=z3",
-                 self._bc_filename],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,  # redirect stderr to stdout
-                # universal_newlines=True  # not compatible with os.set_blocking(False)
-            )
-        except Exception as e:
-            raise RuntimeError("Unable to run KLEE. Error: %s" % e)
+            for filename in self._test_cases.files:
+                with open(filename, "rb") as f:
+                    ktest_data = f.read()
+                cov_data = None
+                if os.path.exists(cov_file_of(filename)):
+                    with open(cov_file_of(filename), "rb") as f:
+                        cov_data = f.read()
+                files.append((ktest_data, cov_data))
+        except OSError as e:
+            print(f"Not caching the KLEE result: {e}")
+            return
 
-        # Set non-blocking stdout
-        os.set_blocking(self._klee_proc.stdout.fileno(), False)
+        stats = []
+        for run in self._klee_runs:
+            run.stats_reader.read_new()
+            stats.append(run.stats_reader.latest)
+        test_cases = copy.copy(self._test_cases)
+        test_cases.files = []  # paths in this session, restored by _restore_klee_result()
+        self._result_cache.store(self._klee_result_key, {
+            "files": files,
+            "test_cases": test_cases,
+            "stats": stats,
+            "return_code": self.get_klee_return_code(),
+            "stop_reason": self.get_klee_stop_reason(),
+        }, checksum=True)
+
+    def _restore_klee_result(self, key: str) -> bool:
+        """
+        Lookup a KLEE result in the cache and restore its test cases into an output directory, as if KLEE had just
+        written them.
+        :return: whether the result was found
+        """
+        result = self._result_cache.load(key, checksum=True)
+        if result is None:
+            return False
 
-    def stop_klee(self):
+        output_dir = os.path.join(self._tmp_dir.name, f"klee-out-{self._current_func_name}-cached")
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        os.makedirs(output_dir)
+        test_cases = result["test_cases"]
+        test_cases.path = output_dir
+        for i, (ktest_data, cov_data) in enumerate(result["files"]):
+            filename = os.path.join(output_dir, f"test{i + 1:06d}.ktest")
+            with open(filename, "wb") as f:
+                f.write(ktest_data)
+            if cov_data is not None:
+                with open(cov_file_of(filename), "wb") as f:
+                    f.write(cov_data)
+            test_cases.files.append(filename)
+
+        self._test_cases = test_cases
+        self._test_case_keys = {tuple(test_case.get(var_name) for var_name in self._watch_vars)
+                                for test_case in self.get_all_klee_test_cases()}
+        result["output_dir"] = output_dir
+        self._cached_klee_result = result
+        self._cached_test_case_count = len(test_cases)
+        return True
+
+    def is_klee_result_cached(self) -> bool:
         """
-        Stop KLEE and return its return code.
+        Whether the current result was taken from the result cache instead of running KLEE, see start_klee().
         """
-        if self._klee_proc is None:
+        return self._cached_klee_result is not None
+
+    def start_klee(self, max_time: Optional[float] = None, on_new_test_cases: Optional[Callable[[], None]] = None,
+                   on_new_output: Optional[Callable[[], None]] = None, log_file: Optional[str] = None,
+                   configs: Optional[list[KLEEConfig]] = None, target_test_cases: Optional[int] = None,
+                   target_coverage: Optional[float] = None, budget: Optional[KLEEBudget] = None,
+                   use_seeds: bool = True, use_result_cache: bool = True, write_coverage: bool = False):
+        """
+        Start KLEE in the background.
+
+        If KLEE already ran to completion on the same bitcode with the same KLEE driver and options, its result is
+        taken from the result cache instead (see is_klee_result_cached()), and is ready to be fetched right away.
+
+        The output directories of the previous start are kept. Their test cases that are still compatible with the
+        KLEE driver seed the new runs (see get_klee_seed_count()), so that KLEE regains their coverage right away
+        before exploring further.
+
+        With several configurations (portfolio mode), one KLEE instance per configuration runs on the same bitcode. If
+        the driver is partitioned (see partition_klee_driver()), one instance per partition and configuration runs.
+        Their test cases are merged into one store, and test cases with the same watched values as an earlier one are
+        dropped. Once a target is reached, all instances are stopped.
+        :param max_time: time budget in seconds passed to KLEE, or None for no limit
+        :param on_new_test_cases: called from a background thread when new test cases are ready to be fetched
+        :param on_new_output: called from a background thread when new output is ready to be read, and at its end
+        :param log_file: file to write the full KLEE output to, or None to only keep the recent output in memory. With
+                         several instances, the label of each instance is added to the file name.
+        :param configs: KLEE configurations, or None for DEFAULT_KLEE_CONFIG only
+        :param target_test_cases: stop once there are this many (merged) test cases, or None
+        :param target_coverage: stop once an instance reaches this instruction coverage in percent, or None
+        :param budget: KLEEBudget enforced by a background governor while KLEE runs, or None for no limit. See
+                       get_klee_stop_reason().
+        :param use_seeds: seed the runs with test cases of previous runs
+        :param use_result_cache: look up and store the result in the result cache. Runs stopped by stop_klee() before
+                                 a target or budget is reached are not stored.
+        :param write_coverage: have KLEE write the covered lines of each test case, for minimize_klee_test_cases()
+        """
+        if configs is None:
+            configs = [DEFAULT_KLEE_CONFIG]
+        if len(set(configs)) != len(configs):
+            raise RuntimeError("KLEE configurations are duplicated")
+        self.stop_klee()
+        for run in self._klee_runs:
+            run.close()
+        self._keep_klee_results()
+
+        self._test_cases = KTestDirectory(self._tmp_dir.name)
+        self._test_case_keys = set()
+        self._target_test_cases = target_test_cases
+        self._target_coverage = target_coverage
+        self._klee_stop_reason = None
+        self._klee_runs = []
+        self._klee_governor = None
+        self._klee_result_key = None
+        self._cached_klee_result = None
+        self._cached_test_case_count = 0
+        self._klee_seed_count = 0
+        self._klee_run_func_name = self._current_func_name
+
+        extra_args = ["--write-cov"] if write_coverage else []
+        if self._klee_entry_point is not None:
+            extra_args.append(f"--entry-point={self._klee_entry_point}")
+        if max_time is not None:
+            # KLEE only takes integers with a unit, or a bare number, and time budgets may be floats
+            extra_args.append(f"--max-time={round(max_time * 1000)}ms")
+
+        bc_filenames = [bc_filename for _, bc_filename in self._klee_partitions] or [self._bc_filename]
+        if use_result_cache:
+            # Seeds only speed up the runs, so they are not part of the key
+            key = self._make_klee_result_key(bc_filenames, configs, extra_args, budget)
+            if self._restore_klee_result(key):
+                return
+            self._klee_result_key = key
+
+        seed_dir = self._make_klee_seeds() if use_seeds else None
+        if seed_dir is not None:
+            extra_args += [f"--seed-dir={seed_dir}", "--named-seed-matching"]
+
+        output_dir = os.path.join(self._tmp_dir.name, f"klee-out-{self._current_func_name}")
+        for k, bc_filename in enumerate(bc_filenames):
+            # Optimize once for all configurations, and across sessions through the cache
+            opt_bc_filename = self._optimize_bitcode(bc_filename)
+            if opt_bc_filename is not None:
+                bc_filename, bc_args = opt_bc_filename, extra_args
+            else:
+                bc_args = ["--optimize"] + extra_args
+            for config in configs:
+                labels = ([f"part{k}"] if len(bc_filenames) > 1 else []) + ([config.name] if len(configs) > 1 else [])
+                if not labels:
+                    run = KLEERun(config, output_dir)
+                    run_log_file = log_file
+                else:
+                    label = "-".join(labels)
+                    run = KLEERun(config, f"{output_dir}-{label}", label)
+                    run_log_file = None
+                    if log_file is not None:
+                        root, ext = os.path.splitext(log_file)
+                        run_log_file = f"{root}-{label}{ext}"
+                self._klee_runs.append(run)
+                run.start(bc_filename, bc_args, self.KLEE_OUTPUT_MAX_LINES, on_new_test_cases=on_new_test_cases,
+                          on_new_output=on_new_output, log_file=run_log_file)
+
+        if budget is not None and not budget.is_unlimited():
+            self._klee_governor = KLEEGovernor(self._klee_runs, budget)
+            self._klee_governor.start()
+
+    def stop_klee(self, wait: bool = True):
+        """
+        Stop KLEE and return its return code. KLEE is interrupted with SIGINT first so that it writes the test cases of
+        its current states, and killed if it does not exit in time.
+        :param wait: wait for KLEE to exit. Otherwise, return None right away and let is_klee_running() tell when KLEE
+                     has exited.
+        """
+        if not self._klee_runs:
             return
-        self._klee_proc.kill()
-        self._klee_proc.wait()
-        return self._klee_proc.returncode
+        if self._klee_governor is not None:
+            self._klee_governor.stop()
+        for run in self._klee_runs:
+            if wait:
+                run.stop()
+            else:
+                run.interrupt()
+        return self.get_klee_return_code() if wait else None
 
     def is_klee_running(self) -> bool:
-        if self._klee_proc is None:
-            return False
-        return self._klee_proc.poll() is None
+        return any(run.is_running() for run in self._klee_runs)
 
     def get_klee_return_code(self) -> int:
-        if self._klee_proc is None:
-            return False
-        return self._klee_proc.returncode
+        """
+        Get the return code of KLEE. In portfolio mode, this is the return code of the first instance that exited by
+        itself, or of the first instance if all of them were stopped.
+        """
+        if not self._klee_runs:
+            return self._cached_klee_result["return_code"] if self._cached_klee_result is not None else False
+        for run in self._klee_runs:
+            if run.return_code is not None and not run.stopped:
+                return run.return_code
+        return self._klee_runs[0].return_code
+
+    def get_klee_stop_reason(self) -> Optional[str]:
+        """
+        Get why KLEE was stopped by the session (a reached target or an exceeded budget), or None.
+        """
+        if self._cached_klee_result is not None:
+            return self._cached_klee_result["stop_reason"]
+        if self._klee_stop_reason is None and self._klee_governor is not None:
+            return self._klee_governor.exceeded
+        return self._klee_stop_reason
+
+    def get_klee_output_dirs(self) -> list[str]:
+        if self._cached_klee_result is not None:
+            return [self._cached_klee_result["output_dir"]]
+        return [run.output_dir for run in self._klee_runs]
+
+    def get_klee_configs(self) -> list[KLEEConfig]:
+        return [run.config for run in self._klee_runs]
+
+    def get_klee_coverage(self) -> float:
+        """
+        Get the highest instruction coverage in percent reported in run.stats by the KLEE instances so far.
+        """
+        if self._cached_klee_result is not None:
+            return max((instruction_coverage(row) for row in self._cached_klee_result["stats"]), default=0.0)
+        ret = 0.0
+        for run in self._klee_runs:
+            run.stats_reader.read_new()
+            ret = max(ret, instruction_coverage(run.stats_reader.latest))
+        return ret
+
+    def _join_klee_output(self, outputs: list[str]) -> str:
+        if len(self._klee_runs) == 1:
+            return outputs[0]
+        # Label the lines of each instance
+        return "".join(f"[{run.label}] {line}"
+                       for run, output in zip(self._klee_runs, outputs) for line in output.splitlines(keepends=True))
 
     def read_klee_output(self) -> str:
         """
-        Non-blocking read of KLEE output.
+        Non-blocking read of KLEE output produced since the last call.
         """
-        read = self._klee_proc.stdout.read()  # os.set_blocking(False) above
-        if read:
-            return read.decode("utf-8")
-        else:
+        if not self._klee_runs:
             return ""
+        return self._join_klee_output([run.output_reader.read_new() for run in self._klee_runs])
 
-    def fetch_new_klee_test_cases(self) -> list[dict]:
-        last_test_case_len = len(self._test_cases)
+    def get_klee_output_tail(self) -> str:
+        """
+        Get the recent KLEE output kept in memory (at most KLEE_OUTPUT_MAX_LINES lines of each instance).
+        """
+        if not self._klee_runs:
+            return ""
+        return self._join_klee_output([run.output_reader.tail() for run in self._klee_runs])
 
-        # Read test cases until no more
-        while os.path.exists(
-                filename := f"{self._klee_output_dir}/test{str(len(self._test_cases) + 1).zfill(6)}.ktest"):
-            # The file may be written by the KLEE at the same time, do error handling
+    async def run_klee(self, max_time: Optional[float] = None, log_file: Optional[str] = None,
+                       configs: Optional[list[KLEEConfig]] = None, target_test_cases: Optional[int] = None,
+                       target_coverage: Optional[float] = None,
+                       budget: Optional[KLEEBudget] = None,
+                       write_coverage: bool = False) -> AsyncIterator[KLEEEvent]:
+        """
+        Run KLEE and asynchronously iterate over its output, new test cases and finally its exit. KLEE is stopped if the
+        iteration is abandoned. The synchronous methods (is_klee_running, stop_klee, get_all_klee_test_cases, etc.)
+        work on the same run.
+        :param max_time: time budget in seconds passed to KLEE, or None for no limit
+        :param log_file: file to write the full KLEE output to, or None
+        :param configs: KLEE configurations, see start_klee()
+        :param target_test_cases: see start_klee()
+        :param target_coverage: see start_klee()
+        :param budget: see start_klee()
+        :param write_coverage: see start_klee()
+        """
+        import asyncio  # only needed by the asynchronous interface, and slow to import
 
-            test_case = {}
-            try:
-                ktest = KTest.fromfile(filename)
-                for name, data in ktest.objects:
-                    if name in self._watch_vars:
-                        test_case[name] = data
-                for name in self._watch_vars:
-                    if name not in test_case:
-                        VarNotFoundError(f"{name} is not found in {filename}")
-            except (VarNotFoundError, KTestError) as e:
-                break  # discard the current test case
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
 
-            # Add the test case
-            self._test_cases.append(test_case)
+        def notify():
+            loop.call_soon_threadsafe(wakeup.set)
 
-        return self._test_cases[last_test_case_len:]
+        self.start_klee(max_time=max_time, on_new_test_cases=notify, on_new_output=notify, log_file=log_file,
+                        configs=configs, target_test_cases=target_test_cases, target_coverage=target_coverage,
+                        budget=budget, write_coverage=write_coverage)
+        if self.is_klee_result_cached():
+            notify()  # there is no output, go straight to the test cases
+        try:
+            while True:
+                await wakeup.wait()
+                wakeup.clear()
+
+                # Check first in order not to lose the last output
+                eof = all(run.output_reader.is_eof() for run in self._klee_runs)
+                output = self.read_klee_output()
+                if output:
+                    yield KLEEEvent(KLEEEventType.OUTPUT, output=output)
+                if eof:
+                    break
+
+                # May block in the final scan of the output directories, if KLEE has just exited
+                test_cases = await loop.run_in_executor(None, self.fetch_new_klee_test_cases)
+                if self._klee_fetch_truncated:
+                    wakeup.set()  # fetch the rest without waiting for KLEE to write another test case
+                if test_cases:
+                    yield KLEEEvent(KLEEEventType.TEST_CASES, test_cases=test_cases)
+
+            # Output is closed, wait for the exit and the remaining test cases
+            for run in self._klee_runs:
+                await loop.run_in_executor(None, run.proc.wait)
+            test_cases = await loop.run_in_executor(None, self.fetch_new_klee_test_cases)
+            if test_cases:
+                yield KLEEEvent(KLEEEventType.TEST_CASES, test_cases=test_cases)
+            yield KLEEEvent(KLEEEventType.EXIT, return_code=self.get_klee_return_code())
+        finally:
+            if self.is_klee_running():
+                self.stop_klee(wait=False)
+
+    def _get_reached_klee_target(self) -> Optional[str]:
+        if self._target_test_cases is not None and len(self._test_cases) >= self._target_test_cases:
+            return f"target of {self._target_test_cases} test cases reached"
+        if self._target_coverage is not None and self.get_klee_coverage() >= self._target_coverage:
+            return f"target of {self._target_coverage}% coverage reached"
+        return None
+
+    def update_klee_test_cases(self) -> int:
+        """
+        Load test cases completed since the last call into the test case store. While KLEE is running, at most
+        FETCH_BATCH_SIZE test cases are loaded at a time. Once it exits, all remaining test cases are loaded.
+        Test cases with the same watched values as an earlier one (from another instance in portfolio mode) are dropped.
+        :return: number of new test cases
+        """
+        if not self._klee_runs:
+            count, self._cached_test_case_count = self._cached_test_case_count, 0
+            return count
+        last_test_case_len = len(self._test_cases)
+        self._klee_fetch_truncated = False
+        finished = not self.is_klee_running()  # before draining, so that no test case written at the exit is missed
+
+        for run in self._klee_runs:
+            filenames = run.drain(self.FETCH_BATCH_SIZE)
+            if len(filenames) >= self.FETCH_BATCH_SIZE:
+                self._klee_fetch_truncated = True
+            for filename in filenames:
+                try:
+                    ktest = KTest.fromfile(filename)
+                except KTestError:
+                    continue  # discard the current test case
+                with ktest:
+                    objects = dict(ktest.objects)  # as append_ktest(), keep the last object of duplicated names
+                    key = tuple(objects.get(var_name) for var_name in self._watch_vars)
+                    if key in self._test_case_keys:
+                        continue
+                    self._test_case_keys.add(key)
+                    self._test_cases.append_ktest(filename, ktest, self._watch_vars)
+
+        if self.is_klee_running() and self._klee_stop_reason is None:
+            self._klee_stop_reason = self._get_reached_klee_target()
+            if self._klee_stop_reason is not None:
+                self.stop_klee(wait=False)
+
+        if finished and self._klee_result_key is not None:
+            # A run stopped by the user is incomplete, unlike one stopped at a target or budget
+            if self.get_klee_stop_reason() is not None or not any(run.stopped for run in self._klee_runs):
+                self._store_klee_result()
+            self._klee_result_key = None
+
+        return len(self._test_cases) - last_test_case_len
+
+    def fetch_new_klee_test_cases(self) -> list[dict]:
+        """
+        Same as update_klee_test_cases(), but return the new test cases as dicts of {watched variable: data}.
+        """
+        count = self.update_klee_test_cases()
+        if count == 0:
+            return []
+        return [self._get_test_case(i) for i in range(len(self._test_cases) - count, len(self._test_cases))]
+
+    def _get_test_case(self, index: int) -> dict[str, bytes]:
+        ret = {}
+        for name, column in self._test_cases.columns.items():
+            data = column[index]
+            if data is not None:
+                ret[name] = data
+        return ret
 
     def get_all_klee_test_cases(self) -> list[dict]:
+        if self._test_cases is None:
+            return []
+        return [self._get_test_case(i) for i in range(len(self._test_cases))]
+
+    def get_klee_test_case_store(self) -> Optional[KTestDirectory]:
+        """
+        Get the test cases of the current KLEE run as columns of watched variables, which is cheaper than
+        get_all_klee_test_cases() for many test cases.
+        """
         return self._test_cases
 
-    def format_data(self, data: bytes, in_hex: bool, unsigned: bool) -> str:
+    def minimize_klee_test_cases(self, rows: Optional[list[int]] = None) -> list[int]:
         """
-        Format the data in hexadecimal.
+        Select a subset of test cases covering the same source lines, from the .cov files KLEE wrote for them (see the
+        write_coverage parameter of start_klee()). Test cases without a .cov file are always selected.
+        :param rows: test cases to select from, or None for all test cases
+        :return: sorted selected rows
         """
-        UNPACK_FORMAT = {
-            1: 'b',
-            2: 'h',
-            4: 'i',
-            8: 'q'
-        }
-        f = UNPACK_FORMAT[len(data)]
-        if unsigned:
-            f = f.upper()
-        else:
-            f = f.lower()
-        value = struct.unpack(f, data)[0]
-        if in_hex:
-            return hex(value)
-        else:
-            return str(value)
+        if self._test_cases is None:
+            return []
+        if rows is None:
+            rows = list(range(len(self._test_cases)))
+        coverage = CoverageBitsets()
+        bitsets = [coverage.load_cov_file(cov_file_of(self._test_cases.files[i])) for i in rows]
+        return [rows[i] for i in minimize(bitsets)]
+
+    def get_watch_vars(self) -> list[str]:
+        """
+        Get the variables watched by the KLEE driver.
+        """
+        return self._watch_vars if self._watch_vars is not None else []
+
+    def get_watch_var_type(self, var_name: str) -> Optional[ValueType]:
+        """
+        Get the type of a watched variable, or None if it is unknown (the value is then decoded by its size).
+        """
+        return self._watch_var_types.get(var_name)
+
+    def format_data(self, data: bytes, in_hex: bool, unsigned: bool, var_name: Optional[str] = None) -> str:
+        """
+        Format the data of a watched variable.
+        :param data: raw bytes
+        :param in_hex: format in hexadecimal
+        :param unsigned: format signed integers as unsigned
+        :param var_name: name of the watched variable to decode by its type, or None to decode by the size of data
+        """
+        return format_value(data, self.get_watch_var_type(var_name), in_hex, unsigned)
+
+    def format_klee_test_case_column(self, var_name: str, in_hex: bool, unsigned: bool,
+                                     start: int = 0) -> list[Optional[str]]:
+        """
+        Format a watched variable of all test cases from start on at once.
+        :return: formatted values, None for test cases without the variable
+        """
+        if self._test_cases is None:
+            return []
+        column = self._test_cases.columns.get(var_name)
+        if column is None:
+            return [None] * (len(self._test_cases) - start)
+        return format_column(column, self.get_watch_var_type(var_name), in_hex, unsigned, start)
+
+    def format_klee_test_case_column_as_code(self, var_name: str, start: int = 0) -> list[Optional[str]]:
+        """
+        Format a watched variable of all test cases from start on as C literals of its type, for
+        generate_catch2_cases(), whatever format the values are displayed in.
+        :return: formatted values, None for test cases without the variable
+        """
+        if self._test_cases is None:
+            return []
+        column = self._test_cases.columns.get(var_name)
+        if column is None:
+            return [None] * (len(self._test_cases) - start)
+        return format_c_literal_column(column, self.get_watch_var_type(var_name), start)
 
     def remove_test_driver_from_test_file(self):
         with open(self._test_file, "w", encoding="utf-8") as f:
@@ -747,8 +1780,6 @@ class KLEEUnitSession:
             e.init = c_ast.Constant(type=e.type.type, value=f'{values[var_name]}')
 
             ret = [e]
-
-            self._watch_vars.append(var_name)
         elif self._is_watch_call(e):
             assert len(e.args.exprs) == 1 and type(e.args.exprs[0]) is c_ast.Cast
             cast = e.args.exprs[0]
@@ -759,10 +1790,8 @@ class KLEEUnitSession:
             e.args.exprs = [c_ast.BinaryOp(op="==", left=c_ast.ID(var_name),
                                            # XXX: int type is not correct, but may not matter for code generation?
                                            right=c_ast.Constant(type=c_ast.IdentifierType(['int']),
-                                                                value=f'{values[var_name]}'))]
+                                                                value=f'{values[self._get_watch_name(var_name)]}'))]
             ret = [e]
-
-            self._watch_vars.append(var_name)
         elif self._is_let_call(e):
             assert len(e.args.exprs) == 1
 
@@ -774,16 +1803,233 @@ class KLEEUnitSession:
 
         return ret
 
-    def generate_catch2_case(self, name: str, values: dict):
+    def _generate_catch2_template(self) -> list[str]:
         """
-        Generate a Catch2 test case.
+        Rewrite the test driver to a Catch2 test case body once, with sentinels in place of the values.
+        :return: alternating code and names of watched variables, starting and ending with code
         """
         func = copy.deepcopy(self._driver_func_ast_copy)
+        sentinels = {var_name: CATCH2_VALUE_SENTINEL.format(i) for i, var_name in enumerate(self._watch_vars)}
         body = []
         for e in func.body.block_items:
-            body.extend(self._rewrite_statement_to_catch2(e, values))
-        compound = c_ast.Compound(body)
+            body.extend(self._rewrite_statement_to_catch2(e, sentinels))
+        parts = CATCH2_VALUE_SENTINEL_PATTERN.split(self._generator.visit(c_ast.Compound(body)))
+        parts[1::2] = [self._watch_vars[int(i)] for i in parts[1::2]]
+        return parts
+
+    @staticmethod
+    def _format_catch2_case(template: list[str], name: str, values: dict) -> str:
+        parts = template.copy()
+        parts[1::2] = [f"{values[var_name]}" for var_name in template[1::2]]
+        return '\nTEST_CASE("' + name + '")\n' + "".join(parts)
 
+    def generate_catch2_case(self, name: str, values: dict):
+        """
+        Generate a Catch2 test case and append it to the test file.
+        """
         with open(self._test_file, "a", encoding="utf-8") as f:
-            f.write('\nTEST_CASE("' + name + '")\n')
-            f.write(self._generator.visit(compound))
+            f.write(self._format_catch2_case(self._generate_catch2_template(), name, values))
+
+    def _generate_catch2_table(self, cases: Iterable[tuple[str, dict]], test_case_name: str) -> Iterable[str]:
+        """
+        Generate a single TEST_CASE with a static table of test cases, looping the test driver over its rows. Nothing is
+        generated without test cases.
+        """
+        # Fields of the table, declared as the watched variables in the driver
+        decls = {e.name: e for e in self._driver_func_ast_copy.body.block_items if type(e) is c_ast.Decl}
+        fields = []
+        for var_name in self._watch_vars:
+            value_type = self.get_watch_var_type(var_name)
+            decl_name = var_name.removesuffix(WATCH_OUTPUT_SUFFIX)
+            if decl_name not in decls or value_type is None or value_type.count is not None:
+                raise RuntimeError(f"{var_name} is not a scalar, which is not supported by table-driven test cases")
+            decl = copy.deepcopy(decls[decl_name])
+            decl.name = decl.type.declname = var_name  # the output value of an input variable gets its own field
+            decl.init = None
+            decl.storage = []
+            decl.quals = []
+            fields.append(self._generator.visit(decl))
+
+        cases = iter(cases)
+        first_case = next(cases, None)
+        if first_case is None:
+            return  # a table without rows would be a zero-length array, which is not standard C++
+        cases = itertools.chain([first_case], cases)
+
+        template = self._generate_catch2_template()
+        body = template.copy()
+        body[1::2] = [f"klee_unit_case.{var_name}" for var_name in template[1::2]]
+        body = "".join(body).strip().removeprefix("{").removesuffix("}").rstrip()
+        body = body.replace("\n", "\n  ")
+
+        yield f'\nTEST_CASE("{test_case_name}")\n{{\n'
+        yield '  struct klee_unit_case_t\n  {\n    const char *name;\n'
+        for field_decl in fields:
+            yield f"    {field_decl};\n"
+        yield '  };\n  static const klee_unit_case_t klee_unit_cases[] = {\n'
+        for name, values in cases:
+            name = name.replace("\\", "\\\\").replace('"', '\\"')
+            yield '    {"' + name + '", ' + ", ".join(f"{values[var_name]}" for var_name in self._watch_vars) + "},\n"
+        yield '  };\n  for (const klee_unit_case_t &klee_unit_case : klee_unit_cases)\n  {\n'
+        yield '    INFO(klee_unit_case.name);'
+        yield body
+        yield '\n  }\n}\n'
+
+    def _make_shard_heading_lines(self) -> list[str]:
+        """
+        Make the heading of the shards other than the test file from the heading of the test file: what the heading
+        defines becomes a declaration (functions and global variables), or is copied (static functions, constants,
+        types, etc.), and the main() of Catch2 is left out.
+        """
+        heading = "".join(self._heading_lines or [])
+        line_offsets = list(itertools.accumulate((len(line) for line in self._heading_lines or []), initial=0))
+
+        # Spans of the heading replaced by declarations
+        replacements = []
+        for node in self._driver_ast.ext:
+            if node.coord is None or node.coord.line >= len(line_offsets) or \
+                    os.path.abspath(node.coord.file) != os.path.abspath(self._tmp_test_file):
+                continue  # from included files, or after the test driver
+            begin = line_offsets[node.coord.line - 1]
+            if replacements and begin < replacements[-1][1]:
+                continue  # another declarator of the same declaration
+            if type(node) is c_ast.FuncDef:
+                if "static" in node.decl.storage or "inline" in node.decl.funcspec:
+                    continue
+                body = _find_outside_brackets(heading, begin, "{")
+                end = _find_matching_brace(heading, body) + 1
+                replacements.append((begin, end, heading[begin:body].rstrip() + ";"))
+            elif type(node) is c_ast.Decl and node.name is not None and type(node.type) is not c_ast.FuncDecl and \
+                    "extern" not in node.storage and "typedef" not in node.storage:
+                object_type = node.type
+                while type(object_type) is c_ast.ArrayDecl:
+                    object_type = object_type.type
+                if "const" in object_type.quals and "volatile" not in object_type.quals:
+                    continue  # copies of a constant do not diverge (and C++ gives it internal linkage anyway)
+                if "static" in node.storage:
+                    raise RuntimeError(f"Static variable {node.name} of the test file cannot be shared by shards")
+                end = _find_outside_brackets(heading, begin, ";") + 1
+                declarators = [declarator.split("=", 1)[0].strip()  # without the initializer
+                               for declarator in _split_outside_brackets(heading[begin:end - 1], ",")]
+                replacements.append((begin, end, "extern " + ", ".join(declarators) + ";"))
+
+        parts = []
+        pos = 0
+        for begin, end, replacement in replacements:
+            parts += [heading[pos:begin], replacement]
+            pos = end
+        parts.append(heading[pos:])
+
+        # Only one translation unit may define the main() of Catch2
+        return [line for line in "".join(parts).splitlines(keepends=True)
+                if not (line.lstrip().startswith("#") and
+                        ("CATCH_CONFIG_MAIN" in line or "CATCH_CONFIG_RUNNER" in line))]
+
+    def get_catch2_shard_files(self, shards: int) -> list[str]:
+        """
+        Get the files of the shards of generated Catch2 test cases. The first shard is the test file itself.
+        """
+        stem, ext = os.path.splitext(self._test_file)
+        return [self._test_file] + [f"{stem}_shard{k}{ext}" for k in range(1, shards)]
+
+    def get_catch2_shard_cmake_file(self) -> str:
+        """
+        Get the CMake snippet registering the shards of generated Catch2 test cases to the test target.
+        """
+        return os.path.splitext(self._test_file)[0] + "_shards.cmake"
+
+    @staticmethod
+    def _write_file_atomically(filename: str, chunks: Iterable[str]) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)), prefix=".klee-unit-")
+        try:
+            with open(fd, "w", encoding="utf-8", buffering=1024 * 1024) as f:
+                f.writelines(chunks)
+            if os.path.exists(filename):
+                shutil.copymode(filename, tmp_path)
+            os.replace(tmp_path, filename)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _read_catch2_shard_cmake_file(self) -> list[str]:
+        """
+        Get the shard files registered by the CMake snippet of a previous generate_catch2_cases().
+        """
+        cmake_file = self.get_catch2_shard_cmake_file()
+        if not os.path.exists(cmake_file):
+            return []
+        with open(cmake_file, "r", encoding="utf-8") as f:
+            content = f.read()
+        if not content.startswith(CATCH2_SHARD_CMAKE_HEADER):
+            return []  # not written by klee-unit
+        test_dir = os.path.dirname(os.path.abspath(self._test_file))
+        return [os.path.join(test_dir, name) for name in re.findall(r'"\$\{CMAKE_CURRENT_LIST_DIR}/([^"/]+)"', content)]
+
+    def _write_catch2_shard_cmake_file(self, shard_files: list[str]) -> None:
+        cmake_file = self.get_catch2_shard_cmake_file()
+        if len(shard_files) == 0 and not os.path.exists(cmake_file):
+            return
+        target = self._target if self._cmake_mode and self._target else "${KLEE_UNIT_TEST_TARGET}"
+        lines = [f"{CATCH2_SHARD_CMAKE_HEADER}: include() after the target {target} is defined to compile the shards of "
+                 f"{os.path.basename(self._test_file)}\n"]
+        if shard_files:
+            lines.append(f"target_sources({target} PRIVATE\n")
+            lines.extend(f'    "${{CMAKE_CURRENT_LIST_DIR}}/{os.path.basename(f)}"\n' for f in shard_files)
+            lines.append(")\n")
+        self._write_file_atomically(cmake_file, lines)
+
+    def generate_catch2_cases(self, cases: Iterable[tuple[str, dict]],
+                              mode: Catch2OutputMode = Catch2OutputMode.CASES, shards: int = 1) -> int:
+        """
+        Replace the test driver in the test file with Catch2 test cases. The driver is rewritten only once, and the
+        new test file is written to a temporary file first, so that the test file is never left half-written.
+        :param cases: (name, values) of each test case
+        :param mode: Catch2OutputMode. In TABLE mode, all watched variables must be scalars, and their values must fit
+                     their types without narrowing, as format_klee_test_case_column_as_code() writes them.
+        :param shards: number of files to split the test cases into, so that they can be compiled in parallel, at most
+                       one per test case. See get_catch2_shard_files() and get_catch2_shard_cmake_file().
+        :return: number of generated test cases
+        """
+        if shards < 1:
+            raise RuntimeError("Number of shards must be positive")
+
+        if shards > 1:
+            cases = list(cases)
+            shards = max(1, min(shards, len(cases)))  # no empty shards
+
+        # Split into contiguous groups differing in size by at most one
+        if shards == 1:
+            groups = [cases]
+        else:
+            size, extra = divmod(len(cases), shards)
+            bounds = [k * size + min(k, extra) for k in range(shards + 1)]
+            groups = [cases[bounds[k]:bounds[k + 1]] for k in range(shards)]
+
+        heading = self._heading_lines if self._heading_lines is not None else []
+        shard_heading = self._make_shard_heading_lines() if shards > 1 else []
+        template = self._generate_catch2_template() if mode == Catch2OutputMode.CASES else None
+
+        count = 0
+
+        def counted(group):
+            nonlocal count
+            for case in group:
+                count += 1
+                yield case
+
+        shard_files = self.get_catch2_shard_files(shards)
+        for k, (filename, group) in enumerate(zip(shard_files, groups)):
+            if mode == Catch2OutputMode.TABLE:
+                name = self._current_func_name if shards == 1 else f"{self._current_func_name} ({k + 1}/{shards})"
+                chunks = self._generate_catch2_table(counted(group), name)
+            else:
+                chunks = (self._format_catch2_case(template, name, values) for name, values in counted(group))
+            self._write_file_atomically(filename, itertools.chain(heading if k == 0 else shard_heading, chunks))
+
+        # Shards left from a previous run with more shards, as listed in its CMake snippet
+        for filename in self._read_catch2_shard_cmake_file():
+            if filename not in shard_files and os.path.exists(filename):
+                os.remove(filename)
+
+        self._write_catch2_shard_cmake_file(shard_files[1:])
+        return count
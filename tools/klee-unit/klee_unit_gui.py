@@ -2,11 +2,13 @@ import sys
 import os
 from typing import Optional
 
-from klee_unit_core import KLEEUnitSession, ArgumentDriverType
+from klee_unit_core import KLEEUnitSession, ArgumentDriverType, Catch2OutputMode
+from klee_run import get_portfolio_klee_configs
 
 from PyQt6 import QtGui, QtWidgets, QtCore
 from PyQt6.QtWidgets import *
 from option_group import OptionGroup
+from test_case_model import TestCaseTableModel
 from mainwindow import Ui_MainWindow
 
 INTRODUCTION_TEXT = """Welcome to KLEE Unit!
@@ -14,6 +16,10 @@ INTRODUCTION_TEXT = """Welcome to KLEE Unit!
 
 
 class MainWindow(QMainWindow, Ui_MainWindow):
+    klee_test_cases_ready = QtCore.pyqtSignal()  # emitted from the test case watcher thread
+
+    LOG_MAX_LINES = KLEEUnitSession.KLEE_OUTPUT_MAX_LINES
+
     ARGUMENT_OPTION_TEXT = {
         ArgumentDriverType.NONE: "None",
         ArgumentDriverType.SYMBOLIC: "Symbolic",
@@ -54,7 +60,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.btnStopKLEE.clicked.connect(self.stop_klee)
         self.radioDec.clicked.connect(lambda _: self.load_test_cases())
         self.radioHex.clicked.connect(lambda _: self.load_test_cases())
-        self.radioSingle.clicked.connect(lambda _: self.load_test_cases())
+        self.radioSigned.clicked.connect(lambda _: self.load_test_cases())
         self.radioUnsigned.clicked.connect(lambda _: self.load_test_cases())
         self.btnTranslateCatch2.clicked.connect(self.translate_catch2_cases)
         self.progressBar.setVisible(False)
@@ -86,8 +92,10 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.klee_fetch_timer.setInterval(500)
         self.klee_fetch_timer.timeout.connect(self.on_klee_fetch_timer_timeout)
         self.klee_fetch_timer.setSingleShot(False)
+        self.klee_test_cases_ready.connect(self.on_klee_test_cases_ready)  # queued across threads
 
-        self.var_column = {}
+        self.test_case_model = TestCaseTableModel(self.session, self)
+        self.tableTests.setModel(self.test_case_model)
 
     # Helper function to show a message in a dialog
     @staticmethod
@@ -175,7 +183,9 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         except Exception as e:
             self.statusbar.showMessage("Fail to analysis source file: {}".format(e))
         else:
-            self.statusbar.showMessage("Successfully analyzed source file")
+            stats = self.session.parse_cache.stats()
+            self.statusbar.showMessage("Successfully analyzed source file "
+                                       "(parse cache: {} hits, {} misses)".format(stats["hits"], stats["misses"]))
             self.btnAnalyzeFunc.setEnabled(True)
 
     @QtCore.pyqtSlot()
@@ -262,15 +272,8 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.reload_test_file()
 
     def load_test_cases(self):
-        test_cases = self.session.get_all_klee_test_cases()
-        self.tableTests.setRowCount(len(test_cases))
-        for i, test_case in enumerate(test_cases):
-            # self.tableTests.setItem(i, 0, QTableWidgetItem(""))  # empty test case name
-            for val, data in test_case.items():
-                val_item = QTableWidgetItem(
-                    self.session.format_data(data, self.radioHex.isChecked(), self.radioUnsigned.isChecked()))
-                val_item.setTextAlignment(QtCore.Qt.AlignmentFlag.AlignRight | QtCore.Qt.AlignmentFlag.AlignVCenter)
-                self.tableTests.setItem(i, self.var_column[val], val_item)
+        self.test_case_model.set_display_format(self.radioHex.isChecked(), self.radioUnsigned.isChecked())
+        self.test_case_model.sync()
 
     @QtCore.pyqtSlot()
     def compile_and_start_klee(self):
@@ -286,13 +289,13 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
         if self.radioCMake.isChecked():
             self.reload_test_file()
+        elif self.spinPartitions.value() > 1:
+            var_name = self.session.partition_klee_driver(self.spinPartitions.value())
+            if var_name is None:
+                self.statusbar.showMessage("No symbolic integer to partition, running KLEE driver as it is")
 
         # Clear the test case table
-        self.tableTests.setColumnCount(1 + len(var_names))
-        self.tableTests.setHorizontalHeaderLabels(["Name"] + var_names)
-        for i, var_name in enumerate(var_names):
-            self.var_column[var_name] = i + 1
-        self.tableTests.setRowCount(0)
+        self.test_case_model.reset(var_names)
 
         # Compile KLEE driver
         clang_return_code, clang_output = self.session.compile_klee_driver()
@@ -307,17 +310,26 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
         # Start KLEE
         try:
-            self.session.start_klee()
+            configs = get_portfolio_klee_configs() if self.checkPortfolio.isChecked() else None
+            self.session.start_klee(on_new_test_cases=self.klee_test_cases_ready.emit, configs=configs,
+                                    write_coverage=self.checkMinimize.isChecked())
         except Exception as e:
             self.statusbar.showMessage("Fail to start KLEE: {}".format(e))
             return
+        if self.session.get_klee_seed_count() > 0:
+            self.logEditor.append_text(f"-- Seeded with {self.session.get_klee_seed_count()} test cases of previous "
+                                       f"runs\n")
         self.progressBar.setVisible(True)
         self.klee_fetch_timer.start()
         self.btnStartKLEE.setEnabled(False)
         self.btnStopKLEE.setEnabled(True)
+        if self.session.is_klee_result_cached():
+            self.logEditor.append_text("-- KLEE result taken from the result cache\n")
+            self.on_klee_fetch_timer_timeout()  # show the test cases right away
 
     def append_log(self, code: str) -> None:
-        self.logEditor.set_text(self.logEditor.get_text() + code)
+        self.logEditor.append_text(code)
+        self.logEditor.truncate_head(self.LOG_MAX_LINES)
 
     @QtCore.pyqtSlot()
     def on_klee_fetch_timer_timeout(self):
@@ -330,13 +342,15 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             self.append_log(new_output)
 
         # Fetch new test cases
-        if len(self.session.fetch_new_klee_test_cases()) > 0:
+        if self.session.update_klee_test_cases() > 0:
             self.load_test_cases()
 
         # Stop timer and print message if KLEE is not running anymore
         if not still_running:
             self.klee_fetch_timer.stop()
             msg = "KLEE exited with code {}".format(self.session.get_klee_return_code())
+            if (reason := self.session.get_klee_stop_reason()) is not None:
+                msg += " ({})".format(reason)
             self.append_log("\n-- {}\n".format(msg))
             self.statusbar.showMessage(msg)
             self.btnTranslateCatch2.setEnabled(True)
@@ -344,42 +358,59 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             self.btnStartKLEE.setEnabled(True)
             self.btnStopKLEE.setEnabled(False)
 
+    @QtCore.pyqtSlot()
+    def on_klee_test_cases_ready(self):
+        if self.session.is_klee_running() and self.session.update_klee_test_cases() > 0:
+            self.load_test_cases()
+
     @QtCore.pyqtSlot()
     def stop_klee(self):
-        self.session.stop_klee()
-        self.on_klee_fetch_timer_timeout()
+        # KLEE writes the test cases of its current states before exiting, which the fetch timer picks up
+        self.session.stop_klee(wait=False)
+        self.btnStopKLEE.setEnabled(False)
+        self.statusbar.showMessage("Stopping KLEE...")
 
     @QtCore.pyqtSlot()
     def translate_catch2_cases(self):
-        try:
-            self.session.remove_test_driver_from_test_file()
-        except Exception as e:
-            self.statusbar.showMessage(str(e))
-
-        for i in range(self.tableTests.rowCount()):
-            name_item = self.tableTests.item(i, 0)
-            if name_item is None or name_item.text() == "":
-                continue  # skip discarded test case
-
+        model = self.test_case_model
+        rows = [i for i in range(model.rowCount()) if model.get_name(i) != ""]  # skip discarded test cases
+        if self.checkMinimize.isChecked():
+            selected = self.session.minimize_klee_test_cases(rows)
+            self.statusbar.showMessage(f"Translating {len(selected)} of {len(rows)} test cases covering the same lines")
+            rows = selected
+
+        # Not the displayed values, which may be in hexadecimal or unsigned
+        columns = {var_name: self.session.format_klee_test_case_column_as_code(var_name)
+                   for var_name in model.get_var_names()}
+        cases = []
+        for i in rows:
             values = {}
-            for var_name in self.var_column.keys():
-                item = self.tableTests.item(i, self.var_column[var_name])
-                if item is None:
-                    self.statusbar.showMessage("Missing {} in row i, why?".format(var_name, i))
+            for var_name, column in columns.items():
+                value = column[i]
+                if value is None:
+                    self.statusbar.showMessage("Missing {} in row {}, why?".format(var_name, i))
                     return
-                values[var_name] = item.text()
+                values[var_name] = value
+            cases.append((model.get_name(i), values))
 
-            try:
-                self.session.generate_catch2_case(name_item.text(), values)
-            except Exception as e:
-                self.statusbar.showMessage("Failed to generate Catch2 test case: {}".format(e))
-                return
+        try:
+            mode = Catch2OutputMode.TABLE if self.checkTable.isChecked() else Catch2OutputMode.CASES
+            self.session.generate_catch2_cases(cases, mode, self.spinShards.value())
+        except Exception as e:
+            self.statusbar.showMessage("Failed to generate Catch2 test cases: {}".format(e))
+            return
 
         self.reload_test_file()
 
 
-if __name__ == '__main__':
+def main() -> int:
+    # The editors import QtWebEngine when they are first shown, after the application is created
+    QtCore.QCoreApplication.setAttribute(QtCore.Qt.ApplicationAttribute.AA_ShareOpenGLContexts)
     app = QApplication(sys.argv)
     w = MainWindow()
     w.showMaximized()
-    sys.exit(app.exec())
+    return app.exec()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
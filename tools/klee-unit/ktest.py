@@ -12,9 +12,13 @@
 
 import binascii
 import io
+import mmap
+import os
 import string
 import struct
 import sys
+from array import array
+from collections.abc import Sequence
 
 version_no = 3
 
@@ -23,44 +27,120 @@ class KTestError(Exception):
     pass
 
 
-class KTest:
-    valid_chars = string.digits + string.ascii_letters + string.punctuation + ' '
+_int32 = struct.Struct('>i')
 
-    @staticmethod
-    def fromfile(path):
-        try:
-            f = open(path, 'rb')
-        except IOError:
-            print('ERROR: file %s not found' % path)
-            sys.exit(1)
+# Smaller files are read in one go, which is cheaper than mapping them
+MMAP_THRESHOLD = 64 * 1024
+
+
+class KTestObjects(Sequence):
+    """
+    Lazy sequence of (name, data) tuples of a ktest file. Names and data are only decoded and copied out of the file
+    buffer when accessed, and view() gives the data as a zero-copy memoryview.
+    """
+
+    def __init__(self, buf, entries):
+        self._buf = memoryview(buf)
+        self._mapping = buf if isinstance(buf, mmap.mmap) else None
+        self._entries = entries  # list of (name offset, name size, data offset, data size)
+
+    def close(self):
+        """
+        Release the file buffer, and unmap it if the file is mapped. The views given by view() must be released first.
+        """
+        self._buf.release()
+        if self._mapping is not None:
+            self._mapping.close()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self.name(index), bytes(self.view(index))
+
+    def name(self, index):
+        offset, size, _, _ = self._entries[index]
+        return str(self._buf[offset:offset + size], 'utf-8')
 
-        hdr = f.read(5)
-        if len(hdr) != 5 or (hdr != b'KTEST' and hdr != b'BOUT\n'):
-            raise KTestError('unrecognized file')
-        version, = struct.unpack('>i', f.read(4))
+    def view(self, index):
+        _, _, offset, size = self._entries[index]
+        return self._buf[offset:offset + size]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def _parse(buf):
+    """
+    Walk the headers of a ktest file in buf.
+    :return: (version, args, symArgvs, symArgvLen, list of (name offset, name size, data offset, data size))
+    """
+    if buf[:5] != b'KTEST' and buf[:5] != b'BOUT\n':
+        raise KTestError('unrecognized file')
+
+    unpack_from = _int32.unpack_from
+    end = len(buf)
+    try:
+        version, = unpack_from(buf, 5)
         if version > version_no:
             raise KTestError('unrecognized version')
-        numArgs, = struct.unpack('>i', f.read(4))
+        numArgs, = unpack_from(buf, 9)
+        pos = 13
         args = []
         for i in range(numArgs):
-            size, = struct.unpack('>i', f.read(4))
-            args.append(str(f.read(size).decode(encoding='ascii')))
+            size, = unpack_from(buf, pos)
+            pos += 4
+            args.append(str(buf[pos:pos + size], 'ascii'))
+            pos += size
 
         if version >= 2:
-            symArgvs, = struct.unpack('>i', f.read(4))
-            symArgvLen, = struct.unpack('>i', f.read(4))
+            symArgvs, = unpack_from(buf, pos)
+            symArgvLen, = unpack_from(buf, pos + 4)
+            pos += 8
         else:
             symArgvs = 0
             symArgvLen = 0
 
-        numObjects, = struct.unpack('>i', f.read(4))
-        objects = []
+        numObjects, = unpack_from(buf, pos)
+        pos += 4
+        entries = []
         for i in range(numObjects):
-            size, = struct.unpack('>i', f.read(4))
-            name = f.read(size).decode('utf-8')
-            size, = struct.unpack('>i', f.read(4))
-            bytes = f.read(size)
-            objects.append((name, bytes))
+            name_size, = unpack_from(buf, pos)
+            name_offset = pos + 4
+            data_size, = unpack_from(buf, name_offset + name_size)
+            data_offset = name_offset + name_size + 4
+            pos = data_offset + data_size
+            if name_size < 0 or data_size < 0 or pos > end:
+                raise KTestError('truncated file')
+            entries.append((name_offset, name_size, data_offset, data_size))
+    except struct.error as e:
+        raise KTestError('truncated file') from e
+
+    return version, args, symArgvs, symArgvLen, entries
+
+
+class KTest:
+    valid_chars = string.digits + string.ascii_letters + string.punctuation + ' '
+
+    @staticmethod
+    def fromfile(path):
+        try:
+            f = open(path, 'rb')
+        except IOError as e:
+            raise KTestError('file %s not found' % path) from e
+
+        with f:
+            buf = f.read(MMAP_THRESHOLD)
+            if len(buf) == MMAP_THRESHOLD:  # maybe larger, map it
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        version, args, symArgvs, symArgvLen, entries = _parse(buf)
+        objects = KTestObjects(buf, entries)
 
         # Create an instance
         b = KTest(version, path, args, symArgvs, symArgvLen, objects)
@@ -74,6 +154,20 @@ class KTest:
         self.args = args
         self.objects = objects
 
+    def close(self):
+        """
+        Release the file buffer of the objects (files of MMAP_THRESHOLD bytes or more are mapped), instead of waiting for
+        the KTest to be garbage collected.
+        """
+        if isinstance(self.objects, KTestObjects):
+            self.objects.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def __format__(self, format_spec):
         sio = io.StringIO()
         width = str(len(str(max(1, len(self.objects) - 1))))
@@ -131,6 +225,208 @@ class KTest:
             sys.exit(f'Could not find object{"s"[:len(missing_objects)^1]}: {", ".join(missing_objects)}')
 
 
+def write_ktest(path, objects, args=(), symArgvs=0, symArgvLen=0):
+    """
+    Write a ktest file, in the format KLEE writes them.
+    :param path: path of the ktest file
+    :param objects: sequence of (name, data) tuples
+    """
+    pack = _int32.pack
+    parts = [b'KTEST', pack(version_no), pack(len(args))]
+    for arg in args:
+        arg = arg.encode('ascii')
+        parts += [pack(len(arg)), arg]
+    parts += [pack(symArgvs), pack(symArgvLen), pack(len(objects))]
+    for name, data in objects:
+        name = name.encode('utf-8')
+        parts += [pack(len(name)), name, pack(len(data)), bytes(data)]
+    with open(path, 'wb') as f:
+        f.write(b''.join(parts))
+
+
+class KTestColumn:
+    """
+    Data of one object over a list of ktests, stored in one contiguous buffer. The data of row i is
+    data[offsets[i]:offsets[i + 1]]. Rows whose ktest has no such object are empty and listed in missing.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.data = bytearray()
+        self.offsets = array('q', [0])
+        self.missing = set()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        """
+        Data of a row, or None if the object is missing in the row.
+        """
+        if index < 0:
+            index += len(self)
+        if index in self.missing:
+            return None
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1]])
+
+    def append(self, data):
+        self.data += data
+        self.offsets.append(len(self.data))
+
+    def append_missing(self):
+        self.missing.add(len(self))
+        self.offsets.append(len(self.data))
+
+    def extend(self, data, sizes):
+        """
+        Append rows given as concatenated data and a list of sizes (-1 for missing).
+        """
+        base = len(self)
+        end = self.offsets[-1]
+        for i, size in enumerate(sizes):
+            if size < 0:
+                self.missing.add(base + i)
+            else:
+                end += size
+            self.offsets.append(end)
+        self.data += data
+
+    @property
+    def item_size(self):
+        """
+        Size shared by all rows, or None if sizes differ or some rows are missing.
+        """
+        if self.missing or len(self) == 0:
+            return None
+        size = self.offsets[1] - self.offsets[0]
+        if self.offsets[-1] != size * len(self):
+            return None
+        if any(self.offsets[i + 1] - self.offsets[i] != size for i in range(len(self))):
+            return None
+        return size
+
+    def to_numpy(self, dtype=None):
+        """
+        Get the rows as a NumPy array, which requires the size of all rows to be the same.
+        :param dtype: element type, by default uint8
+        :return: array of shape (rows,) if a row holds a single element, otherwise (rows, elements per row)
+        """
+        import numpy as np
+
+        size = self.item_size
+        if size is None:
+            raise ValueError(f'rows of {self.name} do not have a fixed size')
+        values = np.frombuffer(self.data, dtype=dtype or np.uint8).copy()  # copy so that the column can grow
+        values = values.reshape(len(self), -1)
+        return values[:, 0] if values.shape[1] == 1 and dtype is not None else values
+
+
+class KTestDirectory:
+    """
+    Columnar content of the ktests in a directory, see load_ktest_dir().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = []
+        self.columns = {}
+        self.skipped = []  # unreadable ktest files
+
+    def __len__(self):
+        return len(self.files)
+
+    def append_ktest(self, path, ktest, names=None):
+        """
+        Append the objects of a KTest as a new row.
+        :param path: path of the ktest file
+        :param ktest: KTest
+        :param names: object names to keep, or None for all
+        """
+        objects = ktest.objects
+        columns = {}
+        for i in range(len(objects)):
+            view = objects.view(i)
+            columns[objects.name(i)] = (view, [len(view)])  # keep the last object of duplicated names
+        self._append([path], columns, names)
+
+    def _append(self, files, columns, names):
+        rows = len(self.files)
+        for name, (data, sizes) in columns.items():
+            if name not in self.columns:
+                if names is not None and name not in names:
+                    continue
+                self.columns[name] = KTestColumn(name)
+                self.columns[name].extend(b'', [-1] * rows)
+            self.columns[name].extend(data, sizes)
+        for name, column in self.columns.items():
+            if name not in columns:
+                column.extend(b'', [-1] * len(files))
+        self.files.extend(files)
+
+
+def _load_ktest_files(paths, names):
+    """
+    Parse ktest files into concatenated data and sizes per object name (-1 for missing).
+    :return: (parsed files, {name: (data, sizes)}, skipped files)
+    """
+    files = []
+    columns = {}
+    skipped = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                buf = f.read()
+            _, _, _, _, entries = _parse(buf)
+        except (OSError, KTestError):
+            skipped.append(path)
+            continue
+
+        row = len(files)
+        files.append(path)
+        for name_offset, name_size, data_offset, data_size in entries:
+            name = str(buf[name_offset:name_offset + name_size], 'utf-8')
+            if names is not None and name not in names:
+                continue
+            if name not in columns:
+                columns[name] = (bytearray(), [-1] * row)
+            data, sizes = columns[name]
+            if len(sizes) > row:  # duplicated name, keep the last object
+                del data[len(data) - sizes.pop():]
+            data += buf[data_offset:data_offset + data_size]
+            sizes.append(data_size)
+        for data, sizes in columns.values():
+            if len(sizes) == row:
+                sizes.append(-1)
+
+    return files, {name: (bytes(data), sizes) for name, (data, sizes) in columns.items()}, skipped
+
+
+def load_ktest_dir(path, names=None, workers=None, chunk_size=1024):
+    """
+    Load all ktests in a directory (e.g. a KLEE output directory) in one pass.
+    :param path: directory
+    :param names: object names to load, or None for all
+    :param workers: number of worker processes, or None/1 to parse in the current process
+    :param chunk_size: number of files parsed by a worker at a time
+    :return: KTestDirectory, with rows in the order of file names
+    """
+    paths = sorted(entry.path for entry in os.scandir(path) if entry.name.endswith('.ktest') and entry.is_file())
+    names = set(names) if names is not None else None
+    ret = KTestDirectory(path)
+
+    if workers is None or workers <= 1 or len(paths) <= chunk_size:
+        results = [_load_ktest_files(paths, names)]
+    else:
+        from concurrent.futures import ProcessPoolExecutor  # spares headless startup its import
+
+        chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_load_ktest_files, chunks, [names] * len(chunks)))
+
+    for files, columns, skipped in results:
+        ret._append(files, columns, names)
+        ret.skipped.extend(skipped)
+    return ret
 
 
 def main():
@@ -178,12 +474,17 @@ def main():
     args = ap.parse_args()
 
     for file in args.files:
-        ktest = KTest.fromfile(file)
-        if args.extract:
-            ktest.extract({x for xs in args.extract for x in xs}, args.trim_zeros)
-        else:
-            fmt = '{:trimzeros}' if args.trim_zeros else '{}'
-            print(fmt.format(ktest), end='')
+        try:
+            ktest = KTest.fromfile(file)
+        except KTestError as e:
+            print('ERROR: %s' % e)
+            sys.exit(1)
+        with ktest:
+            if args.extract:
+                ktest.extract({x for xs in args.extract for x in xs}, args.trim_zeros)
+            else:
+                fmt = '{:trimzeros}' if args.trim_zeros else '{}'
+                print(fmt.format(ktest), end='')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,210 @@
+# -*- encoding: utf-8 -*-
+import os
+import sys
+import queue
+import select
+import struct
+import threading
+import ctypes
+import ctypes.util
+from typing import Optional, Callable, Iterator
+
+from ktest import KTest, KTestError
+
+# inotify(7) constants
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_Q_OVERFLOW = 0x00004000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def _load_inotify():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_libc = _load_inotify()
+
+
+class KTestWatcher:
+    """
+    Watch a KLEE output directory and emit each completed .ktest file exactly once, in a background thread.
+
+    Uses inotify when available (a file is complete once KLEE closes it), and otherwise falls back to scanning the
+    directory with os.scandir (a file is complete once it parses). New files go to a bounded queue, which the consumer
+    drains with drain() or by iterating the watcher. If the queue is full, the watcher thread waits instead of the
+    consumer, until it is stopped.
+    """
+
+    def __init__(self, directory: str, callback: Optional[Callable[[], None]] = None, max_queued: int = 4096,
+                 scan_interval: float = 0.2, use_inotify: bool = True) -> None:
+        """
+        :param directory: KLEE output directory, which may not exist yet
+        :param callback: called from the watcher thread after new files are queued
+        :param max_queued: bound of the queue
+        :param scan_interval: interval in seconds of directory scans when inotify is not used
+        :param use_inotify: use inotify if available
+        """
+        self._dir = directory
+        self._callback = callback
+        self._queue: queue.Queue[str] = queue.Queue(maxsize=max_queued)
+        self._scan_interval = scan_interval
+        self._use_inotify = use_inotify and _libc is not None
+        self._seen: set[str] = set()
+        self._finish_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"KTestWatcher({directory})", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def finish(self) -> None:
+        """
+        Request the watcher to stop once the directory is complete. It does a final scan of the directory before its
+        thread exits, waiting for the consumer to drain the queue if it is full.
+        """
+        self._finish_event.set()
+
+    def stop(self) -> None:
+        """
+        Stop the watcher right away, for when nobody consumes the files anymore: there is no final scan, and the files
+        that do not fit in the queue are dropped.
+        """
+        self._stop_event.set()
+        self._finish_event.set()
+
+    def is_finished(self) -> bool:
+        """
+        Whether the watcher thread has exited and every file has been consumed.
+        """
+        return not self._thread.is_alive() and self._queue.empty()
+
+    @property
+    def emitted(self) -> int:
+        """
+        Number of files emitted so far.
+        """
+        return len(self._seen)
+
+    def drain(self, max_items: Optional[int] = None, until_finished: bool = False) -> list[str]:
+        """
+        Get queued files without blocking.
+        :param max_items: maximal number of files to return, or None for no limit
+        :param until_finished: keep waiting until the watcher thread exits (after finish()), then return everything
+        :return: list of .ktest paths
+        """
+        ret = []
+        while max_items is None or len(ret) < max_items:
+            try:
+                if until_finished and self._thread.is_alive():
+                    ret.append(self._queue.get(timeout=0.05))
+                else:
+                    ret.append(self._queue.get_nowait())
+            except queue.Empty:
+                if until_finished and self._thread.is_alive():
+                    continue
+                break
+        return ret
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Blocking iteration over completed files until the watcher is finished and drained.
+        """
+        while not self.is_finished():
+            try:
+                yield self._queue.get(timeout=0.05)
+            except queue.Empty:
+                pass
+
+    def _emit(self, names: list[str], check_complete: bool) -> None:
+        new_files = []
+        for name in sorted(names):
+            if name in self._seen or not name.endswith(".ktest"):
+                continue
+            path = os.path.join(self._dir, name)
+            if check_complete:
+                try:
+                    KTest.fromfile(path).close()
+                except (KTestError, struct.error, OSError):
+                    continue  # still being written, pick it up later
+            self._seen.add(name)
+            new_files.append(path)
+
+        for path in new_files:
+            while not self._stop_event.is_set():
+                try:
+                    self._queue.put(path, timeout=0.1)
+                    break
+                except queue.Full:
+                    if self._callback is not None:
+                        self._callback()  # make sure the consumer is awake
+        if new_files and self._callback is not None:
+            self._callback()
+
+    def _scan(self) -> None:
+        try:
+            names = [entry.name for entry in os.scandir(self._dir) if entry.is_file()]
+        except FileNotFoundError:
+            return
+        self._emit(names, check_complete=True)
+
+    def _run(self) -> None:
+        # KLEE creates the output directory itself
+        while not os.path.isdir(self._dir):
+            if self._finish_event.wait(0.05):
+                return
+
+        fd = -1
+        if self._use_inotify:
+            fd = _libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd >= 0 and _libc.inotify_add_watch(fd, os.fsencode(self._dir), _IN_CLOSE_WRITE | _IN_MOVED_TO) < 0:
+                os.close(fd)
+                fd = -1
+
+        try:
+            # Files written before the watch was added
+            self._scan()
+
+            while not self._finish_event.is_set():
+                if fd < 0:
+                    self._finish_event.wait(self._scan_interval)
+                    self._scan()
+                    continue
+
+                readable, _, _ = select.select([fd], [], [], 0.1)
+                if not readable:
+                    continue
+                try:
+                    buf = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                names = []
+                overflow = False
+                offset = 0
+                while offset < len(buf):
+                    _, mask, _, name_len = _INOTIFY_EVENT.unpack_from(buf, offset)
+                    offset += _INOTIFY_EVENT.size
+                    if mask & _IN_Q_OVERFLOW:
+                        overflow = True
+                    elif name_len > 0:
+                        names.append(os.fsdecode(buf[offset:offset + name_len].rstrip(b"\0")))
+                    offset += name_len
+                self._emit(names, check_complete=False)
+                if overflow:
+                    self._scan()
+
+            # Anything that was missed
+            if not self._stop_event.is_set():
+                self._scan()
+        finally:
+            if fd >= 0:
+                os.close(fd)
@@ -190,6 +190,14 @@ class Ui_MainWindow(object):
         self.btnStopKLEE = QtWidgets.QPushButton(self.widget)
         self.btnStopKLEE.setObjectName("btnStopKLEE")
         self.horizontalLayout_12.addWidget(self.btnStopKLEE)
+        self.checkPortfolio = QtWidgets.QCheckBox(self.widget)
+        self.checkPortfolio.setObjectName("checkPortfolio")
+        self.horizontalLayout_12.addWidget(self.checkPortfolio)
+        self.spinPartitions = QtWidgets.QSpinBox(self.widget)
+        self.spinPartitions.setMinimum(1)
+        self.spinPartitions.setMaximum(256)
+        self.spinPartitions.setObjectName("spinPartitions")
+        self.horizontalLayout_12.addWidget(self.spinPartitions)
         self.progressBar = QtWidgets.QProgressBar(self.widget)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Policy.Preferred, QtWidgets.QSizePolicy.Policy.Fixed)
         sizePolicy.setHorizontalStretch(0)
@@ -239,15 +247,13 @@ class Ui_MainWindow(object):
         self.horizontalLayout.addWidget(self.radioHex)
         self.horizontalLayout_12.addWidget(self.widget_11)
         self.verticalLayout_3.addWidget(self.widget)
-        self.tableTests = QtWidgets.QTableWidget(self.groupTestCases)
+        self.tableTests = QtWidgets.QTableView(self.groupTestCases)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Policy.Expanding, QtWidgets.QSizePolicy.Policy.Preferred)
         sizePolicy.setHorizontalStretch(0)
         sizePolicy.setVerticalStretch(0)
         sizePolicy.setHeightForWidth(self.tableTests.sizePolicy().hasHeightForWidth())
         self.tableTests.setSizePolicy(sizePolicy)
         self.tableTests.setObjectName("tableTests")
-        self.tableTests.setColumnCount(0)
-        self.tableTests.setRowCount(0)
         self.verticalLayout_3.addWidget(self.tableTests)
         self.widget_9 = QtWidgets.QWidget(self.groupTestCases)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Policy.Preferred, QtWidgets.QSizePolicy.Policy.Maximum)
@@ -262,6 +268,17 @@ class Ui_MainWindow(object):
         self.btnTranslateCatch2 = QtWidgets.QPushButton(self.widget_9)
         self.btnTranslateCatch2.setObjectName("btnTranslateCatch2")
         self.horizontalLayout_10.addWidget(self.btnTranslateCatch2)
+        self.checkMinimize = QtWidgets.QCheckBox(self.widget_9)
+        self.checkMinimize.setObjectName("checkMinimize")
+        self.horizontalLayout_10.addWidget(self.checkMinimize)
+        self.checkTable = QtWidgets.QCheckBox(self.widget_9)
+        self.checkTable.setObjectName("checkTable")
+        self.horizontalLayout_10.addWidget(self.checkTable)
+        self.spinShards = QtWidgets.QSpinBox(self.widget_9)
+        self.spinShards.setMinimum(1)
+        self.spinShards.setMaximum(64)
+        self.spinShards.setObjectName("spinShards")
+        self.horizontalLayout_10.addWidget(self.spinShards)
         spacerItem4 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Policy.Expanding, QtWidgets.QSizePolicy.Policy.Minimum)
         self.horizontalLayout_10.addItem(spacerItem4)
         self.label = QtWidgets.QLabel(self.widget_9)
@@ -384,11 +401,21 @@ class Ui_MainWindow(object):
         self.groupTestCases.setTitle(_translate("MainWindow", "Test Cases"))
         self.btnStartKLEE.setText(_translate("MainWindow", "Start KLEE"))
         self.btnStopKLEE.setText(_translate("MainWindow", "Stop KLEE"))
+        self.checkPortfolio.setToolTip(_translate("MainWindow", "Run KLEE with several searchers and solvers in parallel and merge their test cases"))
+        self.checkPortfolio.setText(_translate("MainWindow", "Portfolio"))
+        self.spinPartitions.setToolTip(_translate("MainWindow", "Split the domain of the first symbolic integer into ranges explored in parallel (single-file mode)"))
+        self.spinPartitions.setPrefix(_translate("MainWindow", "Partitions: "))
         self.radioSigned.setText(_translate("MainWindow", "Signed"))
         self.radioUnsigned.setText(_translate("MainWindow", "Unsigned"))
         self.radioDec.setText(_translate("MainWindow", "Dec"))
         self.radioHex.setText(_translate("MainWindow", "Hex"))
         self.btnTranslateCatch2.setText(_translate("MainWindow", "Translate to Catch2 Test Cases"))
+        self.checkMinimize.setToolTip(_translate("MainWindow", "Only translate a subset of the named test cases that covers the same lines"))
+        self.checkMinimize.setText(_translate("MainWindow", "Minimize by Coverage"))
+        self.checkTable.setToolTip(_translate("MainWindow", "Generate a single TEST_CASE looping over a table of the test cases"))
+        self.checkTable.setText(_translate("MainWindow", "Table-Driven"))
+        self.spinShards.setToolTip(_translate("MainWindow", "Number of files to split the test cases into, to compile them in parallel"))
+        self.spinShards.setPrefix(_translate("MainWindow", "Shards: "))
         self.label.setText(_translate("MainWindow", "Unnamed entries are discarded"))
         self.groupBox_2.setTitle(_translate("MainWindow", "Test Driver"))
         self.labelTestFile.setText(_translate("MainWindow", "Test File"))
@@ -2,7 +2,7 @@ import json
 import os
 import typing
 
-from PyQt6 import QtCore, QtWidgets, QtWebEngineWidgets, QtWebChannel
+from PyQt6 import QtCore, QtWidgets
 
 RESOURCE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "monoaco-editor")
 
@@ -64,49 +64,121 @@ class EditorBridge(BaseBridge):
     theme = QtCore.pyqtProperty(str, fget=getTheme, fset=setTheme, notify=themeChanged)
 
 
-class MonacoEditorWidget(QtWebEngineWidgets.QWebEngineView):
+class MonacoEditorWidget(QtWidgets.QWidget):
+    """
+    Monaco editor in a web view. QtWebEngine is only imported, and the web view created, when the widget is first
+    shown. Messages to the editor are queued until the page is initialized, so that creating the widget never blocks.
+    """
 
     code_changed = QtCore.pyqtSignal(str)
     language_changed = QtCore.pyqtSignal(str)
     theme_changed = QtCore.pyqtSignal(str)
 
+    APPEND_INTERVAL = 16  # ms, appends within an interval are sent together
+
     def __init__(self, parent=None) -> None:
         super().__init__(parent)
+        self._view = None
         self._has_initialized = False
+        self._pending_messages: list[tuple[str, typing.Any]] = []  # sent once the page is initialized
 
-        channel = QtWebChannel.QWebChannel(self)
-        self.page().setWebChannel(channel)
+        # Pending appended text and line limit, sent to JS together by the timer
+        self._pending_append: list[str] = []
+        self._pending_max_lines: typing.Optional[int] = None
+        self._append_timer = QtCore.QTimer(self)
+        self._append_timer.setSingleShot(True)
+        self._append_timer.setInterval(self.APPEND_INTERVAL)
+        self._append_timer.timeout.connect(self._flush_append)
 
         self._bridge = EditorBridge()
-        channel.registerObject("bridge", self.bridge)
-
-        filename = os.path.join(RESOURCE_DIR, "monaco-editor.html")
-        self.load(QtCore.QUrl.fromLocalFile(filename))
-
         self.bridge.initialized.connect(self._initialized)
         self.bridge.valueChanged.connect(lambda: self.code_changed.emit(self.bridge.value))
         self.bridge.languageChanged.connect(lambda: self.language_changed.emit(self.bridge.language))
         self.bridge.themeChanged.connect(lambda: self.theme_changed.emit(self.bridge.theme))
 
-        while not self._has_initialized:
-            QtCore.QCoreApplication.processEvents()
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+    def showEvent(self, event) -> None:
+        super().showEvent(event)
+        if self._view is None:
+            self._create_view()
+
+    def _create_view(self) -> None:
+        # QApplication needs Qt.ApplicationAttribute.AA_ShareOpenGLContexts to import QtWebEngine after its creation
+        from PyQt6 import QtWebEngineWidgets, QtWebChannel
+
+        self._view = QtWebEngineWidgets.QWebEngineView(self)
+        self.layout().addWidget(self._view)
+
+        channel = QtWebChannel.QWebChannel(self._view)
+        self._view.page().setWebChannel(channel)
+        channel.registerObject("bridge", self.bridge)
+
+        filename = os.path.join(RESOURCE_DIR, "monaco-editor.html")
+        self._view.load(QtCore.QUrl.fromLocalFile(filename))
 
     @QtCore.pyqtSlot()
     def _initialized(self) -> None:
         self._has_initialized = True
+        for name, value in self._pending_messages:
+            self.bridge.send_to_js(name, value)
+        self._pending_messages.clear()
+
+    def _send_to_js(self, name: str, value) -> None:
+        if self._has_initialized:
+            self.bridge.send_to_js(name, value)
+        else:
+            self._pending_messages.append((name, value))
 
     @property
     def bridge(self):
         return self._bridge
 
     def set_language(self, language: str):
-        self.bridge.send_to_js("language", language)  # do not use self.bridge.language
+        self._send_to_js("language", language)  # do not use self.bridge.language
 
     def set_theme(self, theme: str):
-        self.bridge.send_to_js("theme", theme)  # do not use self.bridge.theme
+        self._send_to_js("theme", theme)  # do not use self.bridge.theme
 
     def set_text(self, text: str):
-        self.bridge.send_to_js("value", text)  # do not use self.bridge.value
+        self._pending_append.clear()  # overwritten anyway
+        self._pending_max_lines = None
+        if not self._has_initialized:  # so are queued edits of the text
+            self._pending_messages = [(name, value) for name, value in self._pending_messages
+                                      if name not in ("value", "append", "truncateHead")]
+        self._send_to_js("value", text)  # do not use self.bridge.value
+
+    def append_text(self, text: str):
+        """
+        Append text at the end. Only the appended text is sent to the editor, in batches, and it is not echoed back,
+        so get_text() does not include it.
+        """
+        self._pending_append.append(text)
+        self._schedule_flush()
+
+    def truncate_head(self, max_lines: int):
+        """
+        Remove lines from the beginning so that at most max_lines lines remain (after pending appends). Like
+        append_text(), this is not echoed back to get_text(), and it is sent together with the pending appends.
+        """
+        self._pending_max_lines = max_lines
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if not self._append_timer.isActive():
+            self._append_timer.start()
+
+    @QtCore.pyqtSlot()
+    def _flush_append(self):
+        self._append_timer.stop()
+        if self._pending_append:
+            text = "".join(self._pending_append)
+            self._pending_append.clear()
+            self._send_to_js("append", text)
+        if self._pending_max_lines is not None:
+            self._send_to_js("truncateHead", self._pending_max_lines)
+            self._pending_max_lines = None
 
     def get_language(self) -> str:
         return self.bridge.language
@@ -122,6 +194,7 @@ if __name__ == "__main__":
     import sys
 
     sys.argv.append("--remote-debugging-port=8000")
+    QtCore.QCoreApplication.setAttribute(QtCore.Qt.ApplicationAttribute.AA_ShareOpenGLContexts)
 
     app = QtWidgets.QApplication(sys.argv)
 
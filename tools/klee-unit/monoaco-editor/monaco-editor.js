@@ -1,13 +1,21 @@
 var bridge = null;
 var editor = null;
 
+// Edits from Python applied once per animation frame, and not echoed back to Python
+var pendingAppend = [];
+var pendingTruncate = null;
+var editScheduled = false;
+var applyingFromPython = false;
+
 require.config({ paths: { 'vs': 'node_modules/monaco-editor/min/vs' } });
 require(['vs/editor/editor.main'], function () {
     editor = monaco.editor.create(document.getElementById('container'), {
         automaticLayout: true
     });
     editor.onDidChangeModelContent((event) => {
-        sendToPython("value", editor.getModel().getValue())
+        if (!applyingFromPython) {
+            sendToPython("value", editor.getModel().getValue())
+        }
     })
     editor.onDidChangeModelLanguage((event) => {
         sendToPython("language", event.newLanguage)
@@ -24,12 +32,59 @@ function sendToPython(name, value) {
     bridge.receive_from_js(name, JSON.stringify(value));
 }
 
+function scheduleEdits() {
+    if (!editScheduled) {
+        editScheduled = true;
+        window.requestAnimationFrame(applyEdits);
+    }
+}
+
+function applyEdits() {
+    editScheduled = false;
+    var model = editor.getModel();
+    var lineCount = model.getLineCount();
+    var ranges = editor.getVisibleRanges();
+    var atBottom = ranges.length === 0 || ranges[ranges.length - 1].endLineNumber >= lineCount;
+
+    applyingFromPython = true;
+    if (pendingAppend.length > 0) {
+        var column = model.getLineMaxColumn(lineCount);
+        model.applyEdits([{
+            range: new monaco.Range(lineCount, column, lineCount, column),
+            text: pendingAppend.join("")
+        }]);
+        pendingAppend = [];
+    }
+    if (pendingTruncate !== null) {
+        var excess = model.getLineCount() - pendingTruncate;
+        if (excess > 0) {
+            model.applyEdits([{range: new monaco.Range(1, 1, excess + 1, 1), text: ""}]);
+        }
+        pendingTruncate = null;
+    }
+    applyingFromPython = false;
+
+    if (atBottom) {
+        editor.revealLine(model.getLineCount());
+    }
+}
+
 function updateFromPython(name, value) {
     var data = JSON.parse(value)
     switch (name) {
         case "value":
+            pendingAppend = [];
+            pendingTruncate = null;
             editor.getModel().setValue(data);
             break;
+        case "append":
+            pendingAppend.push(data);
+            scheduleEdits();
+            break;
+        case "truncateHead":
+            pendingTruncate = data;
+            scheduleEdits();
+            break;
         case "language":
             monaco.editor.setModelLanguage(editor.getModel(), data);
             break;
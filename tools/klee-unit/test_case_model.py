@@ -0,0 +1,109 @@
+from typing import Optional, Any
+from PyQt6 import QtCore
+from PyQt6.QtCore import Qt, QModelIndex
+
+from klee_unit_core import KLEEUnitSession
+
+
+class TestCaseTableModel(QtCore.QAbstractTableModel):
+    """
+    Table of KLEE test cases backed by the columnar test case store of the session. Column 0 is the (editable) test
+    case name, followed by one column per watched variable. Values are formatted a whole column at a time when the view
+    first asks for them, and cached until the display format changes.
+    """
+
+    def __init__(self, session: KLEEUnitSession, parent: Optional[QtCore.QObject] = None) -> None:
+        super().__init__(parent)
+        self._session = session
+        self._var_names: list[str] = []
+        self._names: list[str] = []  # test case names, "" for discarded test cases
+        self._in_hex = False
+        self._unsigned = False
+        self._formatted: dict[str, list[Optional[str]]] = {}  # formatted values of the first rows of each variable
+
+    def reset(self, var_names: list[str]) -> None:
+        """
+        Clear the test cases and set the watched variables.
+        """
+        self.beginResetModel()
+        self._var_names = list(var_names)
+        self._names = []
+        self._formatted = {}
+        self.endResetModel()
+
+    def sync(self) -> None:
+        """
+        Append rows for test cases added to the store since the last call.
+        """
+        store = self._session.get_klee_test_case_store()
+        rows = len(store) if store is not None else 0
+        if rows > len(self._names):
+            self.beginInsertRows(QModelIndex(), len(self._names), rows - 1)
+            self._names.extend([""] * (rows - len(self._names)))
+            self.endInsertRows()
+
+    def set_display_format(self, in_hex: bool, unsigned: bool) -> None:
+        if (in_hex, unsigned) == (self._in_hex, self._unsigned):
+            return
+        self._in_hex = in_hex
+        self._unsigned = unsigned
+        self._formatted = {}
+        if self._names and self._var_names:
+            self.dataChanged.emit(self.index(0, 1), self.index(len(self._names) - 1, len(self._var_names)),
+                                  [Qt.ItemDataRole.DisplayRole])
+
+    def get_var_names(self) -> list[str]:
+        return self._var_names
+
+    def get_name(self, row: int) -> str:
+        return self._names[row]
+
+    def get_value(self, row: int, var_name: str) -> Optional[str]:
+        """
+        Formatted value of a watched variable, or None if it is missing in the test case.
+        """
+        formatted = self._formatted.setdefault(var_name, [])
+        if row >= len(formatted):
+            formatted.extend(self._session.format_klee_test_case_column(var_name, self._in_hex, self._unsigned,
+                                                                        start=len(formatted)))
+        return formatted[row]
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._names)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else 1 + len(self._var_names)
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+        row, col = index.row(), index.column()
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            if col == 0:
+                return self._names[row]
+            value = self.get_value(row, self._var_names[col - 1])
+            return value if value is not None else ""
+        if role == Qt.ItemDataRole.TextAlignmentRole and col > 0:
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        return None
+
+    def setData(self, index: QModelIndex, value: Any, role: int = Qt.ItemDataRole.EditRole) -> bool:
+        if not index.isValid() or index.column() != 0 or role != Qt.ItemDataRole.EditRole:
+            return False
+        self._names[index.row()] = str(value)
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole])
+        return True
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlag:
+        flags = super().flags(index)
+        if index.isValid() and index.column() == 0:
+            flags |= Qt.ItemFlag.ItemIsEditable
+        return flags
+
+    def headerData(self, section: int, orientation: Qt.Orientation,
+                   role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return "Name" if section == 0 else self._var_names[section - 1]
+        return str(section + 1)
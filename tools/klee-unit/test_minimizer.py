@@ -0,0 +1,81 @@
+# -*- encoding: utf-8 -*-
+import os
+from typing import Optional, Iterable
+
+
+class CoverageBitsets:
+    """
+    Line coverage of test cases as bitsets (Python ints), one bit per covered source line. The bits are assigned in the
+    order the lines are first seen, so bitsets of different test cases can be combined with |, & and ~.
+    """
+
+    def __init__(self) -> None:
+        self._line_bits: dict[str, int] = {}  # "file:line" -> bit index
+
+    def __len__(self) -> int:
+        return len(self._line_bits)
+
+    def bitset(self, lines: Iterable[str]) -> int:
+        """
+        Get the bitset of covered lines, assigning bits to lines not seen before.
+        """
+        ret = 0
+        for line in lines:
+            bit = self._line_bits.setdefault(line, len(self._line_bits))
+            ret |= 1 << bit
+        return ret
+
+    def load_cov_file(self, cov_file: str) -> Optional[int]:
+        """
+        Load a .cov file written by KLEE with --write-cov ("file:line" per covered line).
+        :return: bitset, or None if the file does not exist
+        """
+        try:
+            with open(cov_file, "r", encoding="utf-8", errors="replace") as f:
+                return self.bitset(line.strip() for line in f if line.strip())
+        except FileNotFoundError:
+            return None
+
+
+def _popcount(bitset: int) -> int:
+    return bin(bitset).count("1")
+
+
+def cov_file_of(ktest_file: str) -> str:
+    """
+    Get the .cov file KLEE writes next to a .ktest file.
+    """
+    return os.path.splitext(ktest_file)[0] + ".cov"
+
+
+def minimize(bitsets: list[Optional[int]]) -> list[int]:
+    """
+    Greedy set cover: repeatedly pick the test case covering the most lines not covered yet, then drop picked test
+    cases whose lines are all covered by the other picked ones. The result covers the same lines as all test cases.
+    :param bitsets: coverage of each test case, None if unknown (such test cases are always kept)
+    :return: sorted indices of the selected test cases
+    """
+    selected = [i for i, b in enumerate(bitsets) if b is None]
+    candidates = {i: b for i, b in enumerate(bitsets) if b is not None}
+    target = 0
+    for b in candidates.values():
+        target |= b
+
+    covered = 0
+    while covered != target:
+        # Ties go to the earliest test case, to keep the result stable
+        best = max(candidates, key=lambda i: (_popcount(candidates[i] & ~covered), -i))
+        covered |= candidates.pop(best)
+        selected.append(best)
+
+    # Greedy picks made early can become redundant later
+    picked = [i for i in selected if bitsets[i] is not None]
+    for i in sorted(picked, key=lambda j: _popcount(bitsets[j])):
+        others = 0
+        for j in picked:
+            if j != i:
+                others |= bitsets[j]
+        if bitsets[i] & ~others == 0:
+            picked.remove(i)
+
+    return sorted([i for i in selected if bitsets[i] is None] + picked)
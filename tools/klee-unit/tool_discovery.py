@@ -0,0 +1,70 @@
+# -*- encoding: utf-8 -*-
+import os
+import shutil
+import subprocess
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from disk_cache import DiskCache, KLEE_UNIT_CACHE_DIR
+
+TOOL_CACHE_DIR = os.path.join(KLEE_UNIT_CACHE_DIR, "tools")
+
+REQUIRED_TOOLS = ["klee", "clang", "llvm-dis"]
+
+_tool_cache: Optional[DiskCache] = None  # created on first use
+
+
+def _tool_key(path: str) -> str:
+    # A reinstalled or upgraded binary changes its mtime or size (symlinks are resolved, so that switching the target
+    # of e.g. clang -> clang-14 is noticed as well)
+    real_path = os.path.realpath(path)
+    st = os.stat(real_path)
+    return DiskCache.make_key("version", path, real_path, str(st.st_mtime_ns), str(st.st_size))
+
+
+def _run_version(path: str) -> str:
+    version = subprocess.run([path, "--version"], capture_output=True).stdout.decode("utf-8")
+    lines = version.splitlines(keepends=False)
+    return lines[0] if lines else ""
+
+
+def get_tool_version(executable: str, cache: Optional[DiskCache] = None) -> str:
+    """
+    Find an executable in PATH and get the first line of its --version output, from the cache if the binary has not
+    changed since.
+    :param executable: name of the executable
+    :param cache: DiskCache of versions, or None to always run the executable
+    :return: first line of the version output
+    """
+    path = shutil.which(executable)
+    if path is None:
+        raise RuntimeError(f"{executable} is not found in the system")
+
+    key = _tool_key(path) if cache is not None else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached.decode("utf-8")
+
+    version = _run_version(path)
+    if key is not None:
+        cache.put(key, version.encode("utf-8"))
+    return version
+
+
+def get_tool_versions(executables: Optional[list[str]] = None, use_cache: bool = True) -> dict[str, str]:
+    """
+    Get the versions of several executables concurrently. See get_tool_version().
+    :param executables: names of the executables, by default klee, clang and llvm-dis
+    :param use_cache: look up and store the versions in the on-disk cache
+    :return: {executable: version}, in the order of executables
+    """
+    if executables is None:
+        executables = REQUIRED_TOOLS
+    global _tool_cache
+    if use_cache and _tool_cache is None:
+        _tool_cache = DiskCache(TOOL_CACHE_DIR, max_size=1024 * 1024)
+    cache = _tool_cache if use_cache else None
+    with ThreadPoolExecutor(max_workers=len(executables)) as executor:
+        futures = {executable: executor.submit(get_tool_version, executable, cache) for executable in executables}
+        return {executable: future.result() for executable, future in futures.items()}
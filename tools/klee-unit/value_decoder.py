@@ -0,0 +1,364 @@
+# -*- encoding: utf-8 -*-
+import math
+import struct
+from typing import Optional, Iterable
+from dataclasses import dataclass, replace
+from pycparser import c_ast
+
+from ktest import KTestColumn
+
+INVALID_VALUE = "?"  # formatted data too short for its type
+
+_numpy = None  # imported on first use, as it takes longer to import than the rest of klee-unit
+
+
+def _import_numpy():
+    """
+    Import numpy, or return None if it is not installed (formatting then falls back to struct.iter_unpack).
+    """
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+
+@dataclass(frozen=True)
+class ValueType:
+    """
+    How to decode the bytes of a watched variable.
+    """
+    kind: str  # "i" for signed integers, "u" for unsigned integers, "f" for floating-point numbers
+    size: int  # bytes of an element
+    count: Optional[int] = None  # None for a scalar, number of elements for an array (0 if decided by the data size)
+    byteorder: str = "<"
+
+    @property
+    def struct_code(self) -> str:
+        if self.kind == "f":
+            return {4: "f", 8: "d"}[self.size]
+        code = {1: "b", 2: "h", 4: "i", 8: "q"}[self.size]
+        return code.upper() if self.kind == "u" else code
+
+    @property
+    def numpy_dtype(self) -> str:
+        return f"{self.byteorder}{self.kind}{self.size}"
+
+
+# Sizes on the LP64 targets KLEE runs on
+_C_TYPES = {
+    "char": ("i", 1), "signed char": ("i", 1), "unsigned char": ("u", 1), "_Bool": ("u", 1), "bool": ("u", 1),
+    "short": ("i", 2), "unsigned short": ("u", 2),
+    "int": ("i", 4), "unsigned int": ("u", 4), "unsigned": ("u", 4), "signed": ("i", 4),
+    "long": ("i", 8), "unsigned long": ("u", 8), "long long": ("i", 8), "unsigned long long": ("u", 8),
+    "float": ("f", 4), "double": ("f", 8),
+    "int8_t": ("i", 1), "uint8_t": ("u", 1), "int16_t": ("i", 2), "uint16_t": ("u", 2),
+    "int32_t": ("i", 4), "uint32_t": ("u", 4), "int64_t": ("i", 8), "uint64_t": ("u", 8),
+    "size_t": ("u", 8), "ssize_t": ("i", 8), "ptrdiff_t": ("i", 8), "intptr_t": ("i", 8), "uintptr_t": ("u", 8),
+}
+
+
+def _normalize_type_names(names: list[str]) -> str:
+    names = [n for n in names if n != "int" or len(names) == 1]  # "short int" -> "short", etc.
+    if "signed" in names and len(names) > 1:
+        names.remove("signed")
+    return " ".join(names)
+
+
+def value_type_from_c_type(node: Optional[c_ast.Node], byteorder: str = "<") -> Optional[ValueType]:
+    """
+    Get the ValueType of a declared type.
+    :param node: type of a c_ast.Decl
+    :return: ValueType, or None if the type is not supported
+    """
+    if type(node) is c_ast.ArrayDecl:
+        elem = value_type_from_c_type(node.type, byteorder)
+        if elem is None or elem.count is not None:
+            return None  # multidimensional arrays are not supported
+        count = int(node.dim.value, 0) if type(node.dim) is c_ast.Constant else 0
+        return replace(elem, count=count)
+    if type(node) is c_ast.PtrDecl:
+        return ValueType("u", 8, byteorder=byteorder)
+    if type(node) is c_ast.TypeDecl:
+        if type(node.type) is c_ast.Enum:
+            return ValueType("i", 4, byteorder=byteorder)
+        if type(node.type) is c_ast.IdentifierType:
+            kind_size = _C_TYPES.get(_normalize_type_names(node.type.names))
+            if kind_size is not None:
+                return ValueType(*kind_size, byteorder=byteorder)
+    return None
+
+
+def value_type_from_size(size: int, byteorder: str = "<") -> ValueType:
+    """
+    Guess the ValueType of untyped data: an integer if the size fits, otherwise an array of bytes.
+    """
+    if size in (1, 2, 4, 8):
+        return ValueType("i", size, byteorder=byteorder)
+    return ValueType("u", 1, count=0, byteorder=byteorder)
+
+
+class CTypeSizes:
+    """
+    Sizes of C types laid out as on the LP64 targets KLEE runs on, with the typedefs and the struct and union tags of a
+    translation unit.
+    """
+
+    def __init__(self, ast: c_ast.FileAST, skip_dirs: tuple[str, ...] = ()) -> None:
+        """
+        :param ast: translation unit
+        :param skip_dirs: directories whose typedefs are ignored, such as the fake libc headers of pycparser, where
+                          every type is an int
+        """
+        self._typedefs: dict[str, c_ast.Node] = {}
+        self._tags: dict[tuple[type, str], list[c_ast.Node]] = {}
+        for e in ast.ext:
+            if type(e) is c_ast.Typedef and not (e.coord and str(e.coord.file).startswith(skip_dirs)):
+                self._typedefs[e.name] = e.type
+        for node in self._walk(ast):
+            if type(node) in (c_ast.Struct, c_ast.Union) and node.name and node.decls is not None:
+                self._tags[(type(node), node.name)] = node.decls
+
+    @staticmethod
+    def _walk(node: c_ast.Node) -> Iterable[c_ast.Node]:
+        yield node
+        for _, child in node.children():
+            yield from CTypeSizes._walk(child)
+
+    def sizeof(self, node: c_ast.Node) -> Optional[int]:
+        """
+        Size of a type (c_ast.Typename, or the type of a c_ast.Decl) in bytes.
+        :return: size, or None if it cannot be decided (bit-fields, unknown types, non-constant array sizes, ...)
+        """
+        layout = self._layout(node)
+        return layout[0] if layout is not None else None
+
+    def _layout(self, node: c_ast.Node) -> Optional[tuple[int, int]]:
+        """
+        :return: (size, alignment) of a type
+        """
+        if type(node) in (c_ast.Typename, c_ast.Decl, c_ast.TypeDecl):
+            return self._layout(node.type)
+        if type(node) is c_ast.PtrDecl:
+            return 8, 8
+        if type(node) is c_ast.Enum:
+            return 4, 4
+        if type(node) is c_ast.ArrayDecl:
+            elem = self._layout(node.type)
+            count = self.evaluate(node.dim) if node.dim is not None else None
+            if elem is None or count is None:
+                return None
+            return elem[0] * count, elem[1]
+        if type(node) is c_ast.IdentifierType:
+            name = _normalize_type_names(node.names)
+            if name in _C_TYPES:
+                size = _C_TYPES[name][1]
+                return size, size
+            if len(node.names) == 1 and name in self._typedefs:
+                return self._layout(self._typedefs[name])
+            return None
+        if type(node) in (c_ast.Struct, c_ast.Union):
+            decls = node.decls if node.decls is not None else self._tags.get((type(node), node.name))
+            if decls is None:
+                return None
+            size, align = 0, 1
+            for decl in decls:
+                member = self._layout(decl) if decl.bitsize is None else None
+                if member is None:
+                    return None
+                member_size, member_align = member
+                align = max(align, member_align)
+                if type(node) is c_ast.Struct:
+                    size = -(-size // member_align) * member_align + member_size
+                else:
+                    size = max(size, member_size)
+            return -(-size // align) * align, align
+        return None
+
+    def evaluate(self, expr: c_ast.Node) -> Optional[int]:
+        """
+        Evaluate an integer constant expression made of integers, sizeof of types and arithmetic, such as the size
+        argument of klee_make_symbolic().
+        :return: value, or None if it cannot be evaluated
+        """
+        if type(expr) is c_ast.Constant and expr.type.endswith("int"):
+            value = expr.value.rstrip("uUlL")
+            return int(value, 8) if value.startswith("0") and value.isdigit() else int(value, 0)
+        if type(expr) is c_ast.Cast:
+            return self.evaluate(expr.expr)
+        if type(expr) is c_ast.UnaryOp:
+            if expr.op == "sizeof":
+                return self.sizeof(expr.expr) if type(expr.expr) is c_ast.Typename else None
+            operand = self.evaluate(expr.expr)
+            if operand is None or expr.op not in ("+", "-"):
+                return None
+            return operand if expr.op == "+" else -operand
+        if type(expr) is c_ast.BinaryOp and expr.op in ("+", "-", "*", "/"):
+            left, right = self.evaluate(expr.left), self.evaluate(expr.right)
+            if left is None or right is None or (expr.op == "/" and right == 0):
+                return None
+            if expr.op == "/":
+                return abs(left) // abs(right) * (1 if (left < 0) == (right < 0) else -1)  # truncated, as in C
+            return left + right if expr.op == "+" else left - right if expr.op == "-" else left * right
+        return None
+
+
+def _display_type(value_type: ValueType, unsigned: bool) -> ValueType:
+    if unsigned and value_type.kind == "i":
+        return replace(value_type, kind="u")
+    return value_type
+
+
+def _format_float(value: float) -> str:
+    # Shortest representation that reads back as the same double, used by both format_value() and format_column()
+    return repr(float(value))
+
+
+def _format_c_scalar(value, value_type: ValueType) -> str:
+    if value_type.kind == "f":
+        if math.isnan(value):
+            return "NAN"
+        if math.isinf(value):
+            return "INFINITY" if value > 0 else "-INFINITY"
+        return _format_float(value)
+    if value_type.kind == "i" and value_type.size == 8 and value == -(1 << 63):
+        return f"({value + 1} - 1)"  # the literal 9223372036854775808 does not fit any signed type
+    if value_type.kind == "u" and value >= 1 << 63:
+        return f"{value}u"
+    return str(value)
+
+
+def _format_scalar(value, value_type: ValueType, in_hex: bool) -> str:
+    if value_type.kind == "f":
+        if in_hex:  # raw bits
+            bits = struct.unpack(value_type.byteorder + {4: "I", 8: "Q"}[value_type.size],
+                                 struct.pack(value_type.byteorder + value_type.struct_code, value))[0]
+            return hex(bits)
+        return _format_float(value)
+    return hex(value) if in_hex else str(value)
+
+
+def format_value(data: bytes, value_type: Optional[ValueType], in_hex: bool, unsigned: bool) -> str:
+    """
+    Format the data of a single value.
+    :return: formatted value, INVALID_VALUE if the data is shorter than a scalar of the type
+    """
+    if value_type is None:
+        value_type = value_type_from_size(len(data))
+    value_type = _display_type(value_type, unsigned)
+    count = len(data) // value_type.size
+    values = struct.unpack(f"{value_type.byteorder}{count}{value_type.struct_code}", data[:count * value_type.size])
+    if value_type.count is None:
+        return _format_scalar(values[0], value_type, in_hex) if values else INVALID_VALUE
+    return "{" + ", ".join(_format_scalar(v, value_type, in_hex) for v in values) + "}"
+
+
+def format_c_literal(data: bytes, value_type: Optional[ValueType]) -> str:
+    """
+    Format the data of a single value as a C literal of its type, for generated code: decimal integers of the declared
+    signedness and decimal floating-point numbers, or INFINITY and NAN (from <cmath>, which catch.hpp includes),
+    whatever format the values are displayed in.
+    :return: formatted value, INVALID_VALUE if the data is shorter than a scalar of the type
+    """
+    if value_type is None:
+        value_type = value_type_from_size(len(data))
+    count = len(data) // value_type.size
+    values = struct.unpack(f"{value_type.byteorder}{count}{value_type.struct_code}", data[:count * value_type.size])
+    if value_type.count is None:
+        return _format_c_scalar(values[0], value_type) if values else INVALID_VALUE
+    return "{" + ", ".join(_format_c_scalar(v, value_type) for v in values) + "}"
+
+
+def _fixed_row_size(column: KTestColumn, start: int) -> Optional[int]:
+    np = _import_numpy()
+    rows = len(column) - start
+    if rows <= 0 or any(i >= start for i in column.missing):
+        return None
+    offsets = np.frombuffer(column.offsets, dtype=np.int64)[start:]
+    sizes = np.diff(offsets)
+    if not (sizes == sizes[0]).all():
+        return None
+    return int(sizes[0])
+
+
+def _decode_column(column: KTestColumn, value_type: Optional[ValueType], unsigned: bool, start: int):
+    """
+    Decode the values of rows [start, len(column)) at once with numpy.
+    :return: (array of the values with a row per test case, ValueType they are decoded with), or None if the rows are
+             not all of the same size in whole elements
+    """
+    np = _import_numpy()
+    row_size = _fixed_row_size(column, start) if np is not None else None
+    if row_size is None:
+        return None
+    if value_type is None:
+        value_type = value_type_from_size(row_size)
+    if row_size == 0 or row_size % value_type.size != 0:
+        return None  # not whole elements, formatted as format_value() does
+    value_type = _display_type(value_type, unsigned)
+    values = np.frombuffer(column.data, dtype=value_type.numpy_dtype, offset=column.offsets[start]).copy()
+    return values.reshape(len(column) - start, -1), value_type
+
+
+def _join_rows(formatted, value_type: ValueType) -> list[str]:
+    if value_type.count is None:
+        return formatted[:, 0].tolist()
+    return ["{" + ", ".join(row) + "}" for row in formatted.tolist()]
+
+
+def format_column(column: KTestColumn, value_type: Optional[ValueType], in_hex: bool, unsigned: bool,
+                  start: int = 0) -> list[Optional[str]]:
+    """
+    Format the values of a column at once.
+    :param column: column of a watched variable
+    :param value_type: ValueType, or None to guess from the data size
+    :param start: first row to format
+    :return: formatted values of rows [start, len(column)), None for missing rows
+    """
+    decoded = _decode_column(column, value_type, unsigned, start)
+    if decoded is None:
+        return [format_value(data, value_type, in_hex, unsigned) if (data := column[i]) is not None else None
+                for i in range(start, len(column))]
+    values, value_type = decoded
+
+    np = _import_numpy()
+    if value_type.kind == "f" and in_hex:  # raw bits
+        values = values.view(f"{value_type.byteorder}u{value_type.size}")
+    if in_hex:
+        formatted = np.char.mod("%#x", values)
+    elif value_type.kind == "f":
+        formatted = np.array([_format_float(v) for v in values.ravel().tolist()]).reshape(values.shape)
+    else:
+        formatted = values.astype(str)
+    return _join_rows(formatted, value_type)
+
+
+def format_c_literal_column(column: KTestColumn, value_type: Optional[ValueType],
+                            start: int = 0) -> list[Optional[str]]:
+    """
+    Format the values of a column at once as C literals, see format_c_literal().
+    :param column: column of a watched variable
+    :param value_type: ValueType, or None to guess from the data size
+    :param start: first row to format
+    :return: formatted values of rows [start, len(column)), None for missing rows
+    """
+    decoded = _decode_column(column, value_type, False, start)
+    if decoded is None:
+        return [format_c_literal(data, value_type) if (data := column[i]) is not None else None
+                for i in range(start, len(column))]
+    values, value_type = decoded
+
+    np = _import_numpy()
+    if value_type.kind == "f":
+        formatted = np.array([_format_c_scalar(v, value_type) for v in values.ravel().tolist()]).reshape(values.shape)
+    else:
+        formatted = values.astype(str)
+        if value_type.size == 8:  # the few values that need more than their decimal digits
+            edge = values == -(1 << 63) if value_type.kind == "i" else values >= 1 << 63
+            if edge.any():
+                formatted = formatted.astype(object)
+                formatted[edge] = [_format_c_scalar(v, value_type) for v in values[edge].tolist()]
+    return _join_rows(formatted, value_type)